@@ -0,0 +1,189 @@
+"""
+Birds as NumPy arrays, with an optional boids flocking mode.
+
+Every bird is a row in a handful of arrays, so a whole flock moves in a few
+array operations per frame. While flocking, each bird steers away from
+birds that are too close (separation), towards the heading of its
+neighbors (alignment) and towards their center (cohesion), and drifts with
+the wind. Neighbors are found with a uniform grid: positions and velocities
+are summed per cell, the sums are totalled over every 3x3 block of cells,
+and each bird reads the totals around it, so a frame costs O(n) rather than
+O(n²) and never looks at bird pairs.
+
+Birds are drawn from a small cache of pre-rendered sprites (one per color,
+size, heading and wing position) with a single Surface.blits() call.
+"""
+import math
+import random
+
+import numpy as np
+import pygame
+
+BIRD_COLORS = [(50, 50, 50), (70, 70, 70), (30, 30, 30), (100, 80, 60)]
+WING_FRAMES = 8
+
+FLOCK_SIZE = 2000
+SKY_TOP = 30      # Flocking birds are turned back above this...
+SKY_BOTTOM = 330  # ...and below this
+
+# Boids tuning, in pixels and pixels per frame
+NEIGHBOR_RADIUS = 40
+SEPARATION_RADIUS = 8
+SEPARATION = 0.6
+ALIGNMENT = 0.05
+COHESION = 0.01
+MAX_STEER = 0.1  # Largest change of velocity per frame from the flock
+EDGE_TURN = 0.2
+WIND_PUSH = 0.01
+MIN_SPEED = 1.5
+MAX_SPEED = 3.5
+
+
+def bird_sprite(color, size, direction, wing_offset):
+    """A bird facing `direction` with its wing tips raised by `wing_offset`, and its origin"""
+    origin = (size + 6, size // 2 + 9)
+    surface = pygame.Surface((2 * size + 12, size + 16))
+    surface.fill((255, 0, 255))
+    surface.set_colorkey((255, 0, 255))
+    x, y = origin
+    pygame.draw.ellipse(surface, color, (x - size // 2, y - 3, size, 6))
+    pygame.draw.line(surface, color, (x - 2, y), (x - size, y - size // 2 - wing_offset), 2)
+    pygame.draw.line(surface, color, (x + 2, y), (x + size, y - size // 2 - wing_offset), 2)
+    pygame.draw.circle(surface, color, (x + (size // 2 + 2) * direction, y - 1), min(3, size // 3 + 1))
+    return surface.convert(), origin
+
+
+class Flock:
+    """All birds in the sky, stored column-wise"""
+
+    def __init__(self):
+        self.flocking = False
+        self.position = np.empty((0, 2))
+        self.velocity = np.empty((0, 2))
+        self.wing_phase = np.empty(0)
+        self.wing_speed = np.empty(0)
+        self.wobble = np.empty(0)
+        self.sizes = np.empty(0, np.int32)
+        self.colors = np.empty(0, np.int32)
+        self.sprites = {}  # (color, size, direction, wing frame) -> (sprite, origin)
+
+    def __len__(self):
+        return len(self.position)
+
+    def add(self, count, x=None, direction=None, width=1200):
+        """Add `count` birds; by default at a screen edge flying inwards"""
+        if direction is None:
+            direction = np.where(np.random.random(count) < 0.5, 1, -1)
+        direction = np.broadcast_to(direction, (count,))
+        if x is None:
+            x = np.where(direction == 1, 0, width)
+        position = np.column_stack([np.broadcast_to(x, (count,)).astype(float),
+                                    np.random.uniform(50, 200, count)])
+        velocity = np.column_stack([np.random.uniform(1.5, 3.0, count) * direction, np.zeros(count)])
+        self.position = np.concatenate([self.position, position])
+        self.velocity = np.concatenate([self.velocity, velocity])
+        self.wing_phase = np.concatenate([self.wing_phase, np.random.uniform(0, 2 * math.pi, count)])
+        self.wing_speed = np.concatenate([self.wing_speed, np.random.uniform(0.1, 0.15, count)])
+        self.wobble = np.concatenate([self.wobble, np.random.uniform(0, 2 * math.pi, count)])
+        self.sizes = np.concatenate([self.sizes, np.random.randint(8, 16, count)])
+        self.colors = np.concatenate([self.colors, np.random.randint(0, len(BIRD_COLORS), count)])
+
+    def add_flock(self, count, width, rng=random):
+        """A flock of `count` birds spread over the sky, starting to flock"""
+        self.flocking = True
+        self.add(count, np.random.uniform(0, width, count), rng.choice([1, -1]), width)
+        self.velocity[-count:, 1] = np.random.uniform(-0.5, 0.5, count)
+        self.sizes[-count:] = np.random.randint(4, 9, count)  # Seen from farther away
+
+    def disperse(self):
+        """Stop flocking; every bird flies straight off the side it is heading for"""
+        self.flocking = False
+        speed = np.maximum(np.hypot(self.velocity[:, 0], self.velocity[:, 1]), MIN_SPEED)
+        self.velocity[:, 0] = np.where(self.velocity[:, 0] < 0, -speed, speed)
+        self.velocity[:, 1] = 0
+
+    def keep(self, alive):
+        for name in ("position", "velocity", "wing_phase", "wing_speed", "wobble", "sizes", "colors"):
+            setattr(self, name, getattr(self, name)[alive])
+
+    def clear(self):
+        self.flocking = False
+        self.keep(np.zeros(len(self), bool))
+
+    def _block_totals(self, cell_size, values):
+        """For each bird, the count and the sums of `values` over its 3x3 block of grid cells"""
+        cells = np.floor(self.position / cell_size).astype(np.int64)
+        cells -= cells.min(axis=0)
+        columns, rows = cells.max(axis=0) + 1
+        keys = cells[:, 0] * rows + cells[:, 1]
+        totals = []
+        for weights in [None, *values.T]:
+            grid = np.bincount(keys, weights, columns * rows).reshape(columns, rows)
+            padded = np.pad(grid, 1)
+            block = sum(padded[1 + dx:columns + 1 + dx, 1 + dy:rows + 1 + dy]
+                        for dx in (-1, 0, 1) for dy in (-1, 0, 1))
+            totals.append(block[cells[:, 0], cells[:, 1]])
+        return totals[0], np.column_stack(totals[1:])
+
+    def _steer(self, wind_strength):
+        """Boids acceleration for every bird"""
+        position, velocity = self.position, self.velocity
+        # Cohesion and alignment: the other birds in the surrounding cells
+        count, sums = self._block_totals(NEIGHBOR_RADIUS, np.hstack([position, velocity]))
+        others = np.maximum(count - 1, 1)[:, None]
+        lonely = count <= 1
+        cohesion = (sums[:, :2] - position) / others - position
+        alignment = (sums[:, 2:] - velocity) / others - velocity
+        cohesion[lonely] = 0
+        alignment[lonely] = 0
+
+        # Separation: away from the center of the birds crowding close by
+        count, sums = self._block_totals(SEPARATION_RADIUS, position)
+        others = np.maximum(count - 1, 1)[:, None]
+        away = position - (sums - position) / others
+        distance2 = np.maximum((away ** 2).sum(axis=1), 1.0)[:, None]
+        separation = away * ((count - 1)[:, None] / distance2)
+
+        steer = SEPARATION * separation + ALIGNMENT * alignment + COHESION * cohesion
+        size = np.maximum(np.hypot(steer[:, 0], steer[:, 1]), 1e-6)[:, None]
+        steer *= np.minimum(size, MAX_STEER) / size
+        steer[:, 0] += wind_strength * WIND_PUSH
+        steer[:, 1] += EDGE_TURN * ((position[:, 1] < SKY_TOP).astype(float) - (position[:, 1] > SKY_BOTTOM))
+        return steer
+
+    def update(self, wind_strength, width):
+        """Advance every bird by one frame; stray birds leave the screen and are removed"""
+        if not len(self):
+            return
+        self.wing_phase += self.wing_speed
+        self.wobble += 0.02
+        if self.flocking:
+            self.velocity += self._steer(wind_strength)
+            speed = np.maximum(np.hypot(self.velocity[:, 0], self.velocity[:, 1]), 1e-6)[:, None]
+            self.velocity *= np.clip(speed, MIN_SPEED, MAX_SPEED) / speed
+        self.position += self.velocity
+        self.position[:, 0] += wind_strength * 0.2
+        self.position[:, 1] += np.sin(self.wobble) * 0.3
+        if self.flocking:
+            # The flock wraps around instead of leaving
+            self.position[:, 0] = (self.position[:, 0] + 50) % (width + 100) - 50
+        else:
+            x = self.position[:, 0]
+            self.keep((x >= -50) & (x <= width + 50))
+
+    def draw(self, screen):
+        frames = (self.wing_phase % (2 * math.pi) * (WING_FRAMES / (2 * math.pi))).astype(np.int32)
+        headings = np.where(self.velocity[:, 0] < 0, -1, 1)
+        sprites = self.sprites
+        blits = []
+        for color, size, heading, frame, x, y in zip(self.colors.tolist(), self.sizes.tolist(),
+                                                     headings.tolist(), frames.tolist(),
+                                                     self.position[:, 0].tolist(), self.position[:, 1].tolist()):
+            key = (color, size, heading, frame)
+            entry = sprites.get(key)
+            if entry is None:
+                wing_offset = round(math.sin(frame * 2 * math.pi / WING_FRAMES) * 5)
+                entry = sprites[key] = bird_sprite(BIRD_COLORS[color], size, heading, wing_offset)
+            sprite, (ox, oy) = entry
+            blits.append((sprite, (x - ox, y - oy)))
+        screen.blits(blits, doreturn=False)
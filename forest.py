@@ -0,0 +1,84 @@
+"""
+Procedural forests: Poisson-disk tree placement across a wide scrolling world.
+
+Trees are scattered over an (x, distance) plane with Bridson's algorithm, so
+they neither bunch up nor leave large gaps. A tree's distance sets its place
+in the depth-sorted scene: far trees are drawn first, smaller, rooted closer
+to the horizon, scroll more slowly and are built with fewer recursion levels.
+"""
+import math
+import random
+
+WORLD_WIDTH = 4800     # Width of the scrolling world for near trees
+FOREST_SIZE = 500      # Trees planted by one press of F
+FOREST_SEEDS = 16      # Shapes a forest is drawn from (see tree_instances)
+
+FAR_SCALE = 0.4        # Size of the farthest trees relative to the nearest
+FAR_DEPTH_DROP = 3     # Recursion levels dropped at the far edge
+HORIZON_RISE = 70      # Pixels the farthest trees are rooted above the nearest
+DISTANCE_SPAN = 400    # Weight of the distance axis against x when spacing trees
+
+
+def perspective(distance):
+    """(scale, recursion levels dropped, rise above the ground) at `distance` (0 near, 1 far)"""
+    return 1 - (1 - FAR_SCALE) * distance, round(distance * FAR_DEPTH_DROP), distance * HORIZON_RISE
+
+
+def poisson_disk_samples(width, height, radius, rng=random, attempts=30):
+    """Points in a width x height box, none closer than `radius` (Bridson's algorithm)"""
+    cell = radius / math.sqrt(2)
+    columns, rows = int(width / cell) + 1, int(height / cell) + 1
+    grid = [None] * (columns * rows)  # At most one point per cell
+
+    def fits(x, y):
+        column, row = int(x / cell), int(y / cell)
+        for r in range(max(0, row - 2), min(rows, row + 3)):
+            for c in range(max(0, column - 2), min(columns, column + 3)):
+                other = grid[r * columns + c]
+                if other is not None and (other[0] - x) ** 2 + (other[1] - y) ** 2 < radius * radius:
+                    return False
+        return True
+
+    def add(x, y):
+        grid[int(y / cell) * columns + int(x / cell)] = (x, y)
+        samples.append((x, y))
+        active.append((x, y))
+
+    samples = []
+    active = []
+    add(rng.uniform(0, width), rng.uniform(0, height))
+    while active:
+        index = rng.randrange(len(active))
+        ax, ay = active[index]
+        for _ in range(attempts):
+            angle = rng.uniform(0, 2 * math.pi)
+            reach = rng.uniform(radius, 2 * radius)
+            x, y = ax + reach * math.cos(angle), ay + reach * math.sin(angle)
+            if 0 <= x < width and 0 <= y < height and fits(x, y):
+                add(x, y)
+                break
+        else:
+            active[index] = active[-1]
+            active.pop()
+    return samples
+
+
+def forest_layout(count, view_width, world_width=WORLD_WIDTH, rng=random):
+    """(x, distance) of up to `count` evenly spread trees, farthest first.
+
+    Far trees scroll more slowly, so their x is squeezed to the part of the
+    world they can show.
+    """
+    # Bridson fills the box with a little over 0.6 points per radius squared
+    radius = math.sqrt(0.6 * world_width * DISTANCE_SPAN / count)
+    points = poisson_disk_samples(world_width, DISTANCE_SPAN, radius, rng)
+    if len(points) > count:
+        points = rng.sample(points, count)
+    layout = []
+    for x, y in points:
+        distance = y / DISTANCE_SPAN
+        parallax = perspective(distance)[0]
+        span = view_width + (world_width - view_width) * parallax
+        layout.append((x * span / world_width, distance))
+    layout.sort(key=lambda tree: -tree[1])
+    return layout
@@ -0,0 +1,166 @@
+"""
+Worker pool that rebuilds tree geometry off the main thread.
+
+Building a tree is a NumPy geometry pass followed by rasterizing its sprite
+indices; for a deep tree the second part dominates. Both run in worker
+processes, which send back the geometry arrays and zlib-compressed sprite
+indices. Until a rebuild arrives the tree keeps drawing its old layers, and
+the new ones are swapped in as a whole.
+
+With a GeometryStore, workers read stored geometry instead of generating it,
+and geometry they do generate is appended to the store when it arrives.
+
+A pool with no workers builds everything during flush() instead, so builds
+always arrive on the same frame; replayed sessions use that.
+
+A worker that dies (e.g. killed for running out of memory) breaks the whole
+process pool. Its builds then fail, the trees keep their old layers and ask
+again, and the pool is replaced. After MAX_RESTARTS replacements the pool
+builds inline from then on.
+"""
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from geometry_store import GeometryStore
+from tree_geometry import generate_tree_geometry
+from tree_render import TreeLayers, rasterize_layer_data
+
+# Rebuilds sent to a worker together; keeps per-job overhead low when a
+# whole forest is rebuilt at once
+BUILDS_PER_JOB = 8
+
+MAX_RESTARTS = 3  # Broken pools replaced before building inline instead
+
+_worker_stores = {}  # Path -> read-only GeometryStore, opened once per worker
+
+
+def _worker_geometry(params, store_path):
+    if store_path is None:
+        return generate_tree_geometry(params)
+    store = _worker_stores.get(store_path)
+    if store is None:
+        store = _worker_stores[store_path] = GeometryStore(store_path, writable=False)
+    return store.load(params)
+
+
+def build_layer_data(jobs, store_path=None):
+    """Worker job: for each (params, level), geometry rasterized up to level"""
+    return [rasterize_layer_data(_worker_geometry(params, store_path), level) for params, level in jobs]
+
+
+class GeometryBuild:
+    """A rebuild requested for one tree"""
+
+    def __init__(self, params, level, pool):
+        self.params = params
+        self.level = level
+        self.pool = pool
+        self.future = None    # Set once the build is sent to a worker
+        self.executor = None  # Executor running the build
+        self.index = 0        # Position of this build in its job
+        self.cancelled = False
+        self._layers = None
+
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    def layers(self):
+        """The built TreeLayers, or None if the build failed; trees sharing this build get the same object"""
+        if self._layers is None:
+            error = self.future.exception()
+            if error is not None:
+                # Dropped; trees asking again get a new build
+                self.cancelled = True
+                if isinstance(error, BrokenProcessPool):
+                    self.pool.restart(self.executor)
+                return None
+            geometry, *sprites = self.future.result()[self.index]
+            store = self.pool.store
+            if store is not None and store.writable:
+                # Keep the mapped copy rather than the one unpickled onto the heap
+                geometry = store.add(geometry)
+            self._layers = TreeLayers.from_data((geometry, *sprites))
+        return self._layers
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class InlineExecutor:
+    """Runs every job as soon as it is submitted, in the calling process"""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+class GeometryPool:
+    """Process pool for tree rebuilds.
+
+    Workers are started with "spawn" so they only import the geometry and
+    render modules, never the running simulator. Requests made during a frame
+    are queued and sent in batches by flush().
+    """
+
+    def __init__(self, workers=None, store=None):
+        if workers is None:
+            workers = max(1, (os.cpu_count() or 2) - 1)
+        os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+        self.workers = workers
+        self.executor = self._start(workers)
+        self.queued = []
+        self.store = store
+        self.restarts = 0
+
+    def _start(self, workers):
+        if workers == 0:
+            return InlineExecutor()
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def restart(self, broken):
+        """Replace the executor `broken` after a worker died, unless that was done already"""
+        if self.executor is not broken:
+            return
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.restarts += 1
+        self.executor = self._start(self.workers if self.restarts <= MAX_RESTARTS else 0)
+
+    def submit_job(self, fn, *args):
+        """Run `fn(*args)` on the executor, replacing it first if a worker died; returns the Future"""
+        try:
+            return self.executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self.restart(self.executor)
+            return self.executor.submit(fn, *args)
+
+    def submit(self, params, level):
+        """Request a build of `params` rasterized up to `level`"""
+        build = GeometryBuild(params, level, self)
+        self.queued.append(build)
+        return build
+
+    def flush(self):
+        """Send the builds requested since the last flush to the workers"""
+        builds = [build for build in self.queued if not build.cancelled]
+        self.queued = []
+        store_path = self.store.path if self.store is not None else None
+        for start in range(0, len(builds), BUILDS_PER_JOB):
+            chunk = builds[start:start + BUILDS_PER_JOB]
+            jobs = [(build.params, build.level) for build in chunk]
+            future = self.submit_job(build_layer_data, jobs, store_path)
+            for index, build in enumerate(chunk):
+                build.future = future
+                build.executor = self.executor
+                build.index = index
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,153 @@
+"""
+On-disk store of tree geometry, memory-mapped back in.
+
+Every generated TreeGeometry is appended to one file as flat float32/uint8
+arrays behind a small header holding its TreeParams. The file is mapped with
+NumPy, so a stored tree costs no heap memory: its arrays are views into the
+mapping and the OS pages them in when a visible tree is rasterized (and may
+page them out again). Geometry generated in an earlier run loads without
+being rebuilt.
+
+The main process is the only writer; worker processes open the store
+read-only and pick up records appended since they last looked. The writer
+reserves room at the end of the file in growing steps, so the file (and
+with it the mapping every stored tree keeps alive) is mapped again only a
+handful of times however many trees are added. The reserved room is cut off
+again by close(). A writer holds an exclusive lock on the file; a second
+process asking to write (e.g. a replay while the simulator is open) gets
+the store read-only instead.
+"""
+import os
+import struct
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are not locked out of each other
+    fcntl = None
+
+from tree_geometry import TreeGeometry, TreeParams, generate_tree_geometry
+
+STORE_PATH = "geometry_cache/trees.bin"
+STORE_LIMIT = 512 * 1024 * 1024  # A larger store is started afresh when opened
+STORE_CHUNK = 16 * 1024 * 1024   # Least room the writer reserves at a time
+
+_MAGIC = b"TRE2"
+# Magic, record length, the first six TreeParams fields, the segment, leaf
+# and bark dot counts and the bark flag (which keeps the arrays 8-byte aligned)
+_HEADER = struct.Struct("<4sIqqddddIIII")
+
+# (attribute, dtype, columns) in record order
+_ARRAYS = (("segments", np.float32, 5), ("colors", np.uint8, 1), ("leaves", np.float32, 4),
+           ("leaf_slots", np.uint8, 1), ("bark", np.float32, 2), ("bark_nodes", np.int32, 1))
+
+
+def _padded(data):
+    return data + b"\0" * (-len(data) % 8)
+
+
+class GeometryStore:
+    """Append-only file of TreeGeometry records keyed by TreeParams"""
+
+    def __init__(self, path=STORE_PATH, writable=True):
+        self.path = path
+        self.writable = writable
+        self.index = {}  # TreeParams -> (offset of the arrays, segments, leaves, bark dots)
+        self.end = 0     # End of the last complete record
+        self.map = None
+        self.file = None
+        if writable:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.file = open(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), "r+b")
+            try:
+                if fcntl is not None:
+                    fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another process is writing; read what it stores
+                self.file.close()
+                self.file = None
+                self.writable = writable = False
+            else:
+                if os.path.getsize(path) > STORE_LIMIT:
+                    self.file.truncate(0)
+        self._refresh()
+        if writable and os.path.getsize(path) > self.end:
+            # Left over from an interrupted write or reserved room never cut off
+            self.file.truncate(self.end)
+            self.map = np.memmap(path, np.uint8, "r") if self.end else None
+        self.capacity = self.end  # Bytes of the file the writer may fill
+
+    def _refresh(self):
+        """Index the records added since the last look, mapping the file again only if it grew"""
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size > (len(self.map) if self.map is not None else 0):
+            self.map = np.memmap(self.path, np.uint8, "r")
+        size = len(self.map) if self.map is not None else 0
+        while self.end + _HEADER.size <= size:
+            magic, length, *params, segments, leaves, bark, with_bark = _HEADER.unpack_from(self.map, self.end)
+            if magic != _MAGIC or self.end + length > size:
+                break
+            self.index[TreeParams(*params, bool(with_bark))] = (self.end + _HEADER.size, segments, leaves, bark)
+            self.end += length
+
+    def __contains__(self, params):
+        return params in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, params):
+        """Stored geometry of `params` as views into the mapped file, or None"""
+        entry = self.index.get(params)
+        if entry is None and not self.writable:
+            self._refresh()
+            entry = self.index.get(params)
+        if entry is None:
+            return None
+        offset, segments, leaves, bark = entry
+        rows = {"segments": segments, "colors": segments, "leaves": leaves,
+                "leaf_slots": leaves, "bark": bark, "bark_nodes": bark}
+        arrays = []
+        for name, dtype, columns in _ARRAYS:
+            size = rows[name] * columns * np.dtype(dtype).itemsize
+            array = self.map[offset:offset + size].view(dtype)
+            arrays.append(array.reshape(-1, columns) if columns > 1 else array)
+            offset += size + (-size % 8)
+        return TreeGeometry(params, *arrays)
+
+    def add(self, geometry):
+        """Append `geometry` unless its params are stored already; returns the stored copy"""
+        params = geometry.params
+        if params not in self.index:
+            body = b"".join(_padded(np.ascontiguousarray(getattr(geometry, name), dtype).tobytes())
+                            for name, dtype, _ in _ARRAYS)
+            header = _HEADER.pack(_MAGIC, _HEADER.size + len(body), *params[:6], len(geometry.segments),
+                                  len(geometry.leaves), len(geometry.bark), params.bark)
+            record = header + body
+            if self.end + len(record) > self.capacity:
+                self.capacity = max(2 * self.capacity, self.end + len(record) + STORE_CHUNK)
+                self.file.truncate(self.capacity)
+            # The magic goes in last, so readers never index a record still being written
+            self.file.seek(self.end + len(_MAGIC))
+            self.file.write(record[len(_MAGIC):])
+            self.file.flush()
+            self.file.seek(self.end)
+            self.file.write(_MAGIC)
+            self.file.flush()
+            self._refresh()
+        return self.get(params)
+
+    def load(self, params):
+        """Geometry of `params`, generated and stored first if it is new"""
+        geometry = self.get(params)
+        if geometry is None:
+            geometry = generate_tree_geometry(params)
+            if self.writable:
+                geometry = self.add(geometry)
+        return geometry
+
+    def close(self):
+        if self.file is not None:
+            self.file.truncate(self.end)
+            self.file.close()
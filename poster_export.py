@@ -0,0 +1,292 @@
+"""
+Poster-resolution export of the tree scene.
+
+The scene is scaled to the requested width and cut into square tiles. Each
+tile is rasterized in a worker process from the tree geometry, drawing only
+the branches, leaves and snow caps whose bounding boxes intersect it. Finished
+tiles are written straight into a tiled TIFF, so the full canvas never has to
+fit in memory.
+"""
+import os
+import struct
+import zlib
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, wait
+from functools import lru_cache
+
+import numpy as np
+import pygame
+
+from seasons import LEAF_FILL_BASE, LEAF_VEIN_BASE, SNOW_BASE, TRANSPARENT_KEY
+from tree_geometry import (BARK_COLOR_INDEX, BRANCH_PALETTE, LEAF_RADII, LEAF_SLOTS,
+                           generate_tree_geometry, leaf_polygons)
+
+TILE_SIZE = 512      # Pixels per tile side (TIFF needs a multiple of 16)
+POSTER_DPI = 300
+SKY_GRADIENT = 200   # Scene pixels of darkening sky at the top, as on screen
+
+# Everything a worker needs to draw the scene. `trees` holds
+# (TreeParams, x, y, grown levels, scale) and the palettes come from SeasonBlend.
+PosterScene = namedtuple("PosterScene", ["width", "height", "sky_color", "ground_color", "ground_y",
+                                         "snowy_ground", "trees", "leaf_palette", "snow_palette"])
+
+
+@lru_cache(maxsize=512)
+def _tree_boxes(params):
+    """Geometry of `params` plus per-branch bounding boxes (relative to the trunk base)"""
+    geometry = generate_tree_geometry(params)
+    seg = geometry.segments
+    half = seg[:, 4] / 2
+    boxes = np.column_stack([np.minimum(seg[:, 0], seg[:, 2]) - half, np.minimum(seg[:, 1], seg[:, 3]) - half,
+                             np.maximum(seg[:, 0], seg[:, 2]) + half, np.maximum(seg[:, 1], seg[:, 3]) + half])
+    return geometry, boxes, geometry.bounds()
+
+
+def _intersecting(boxes, window):
+    left, top, right, bottom = window
+    return np.nonzero((boxes[:, 2] >= left) & (boxes[:, 0] <= right)
+                      & (boxes[:, 3] >= top) & (boxes[:, 1] <= bottom))[0]
+
+
+def _draw_thick_segment(surface, color, start, end, width):
+    """Line with round caps, so thick branches still join up when scaled up"""
+    if width < 3:
+        pygame.draw.line(surface, color, start, end, width)
+        return
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    length = max(1e-6, (dx * dx + dy * dy) ** 0.5)
+    nx, ny = -dy / length * width / 2, dx / length * width / 2
+    pygame.draw.polygon(surface, color, [(start[0] + nx, start[1] + ny), (end[0] + nx, end[1] + ny),
+                                         (end[0] - nx, end[1] - ny), (start[0] - nx, start[1] - ny)])
+    pygame.draw.circle(surface, color, start, width / 2)
+    pygame.draw.circle(surface, color, end, width / 2)
+
+
+def _draw_tree(tile, scene, params, x, y, level, tree_scale, scale, origin):
+    """Draw the parts of one tree that fall inside the tile at `origin` (poster pixels)"""
+    geometry, boxes, bounds = _tree_boxes(params)
+    width, height = tile.get_size()
+    # The tile in geometry units, relative to the trunk base
+    window = ((origin[0] / scale - x) / tree_scale, (origin[1] / scale - y) / tree_scale,
+              ((origin[0] + width) / scale - x) / tree_scale, ((origin[1] + height) / scale - y) / tree_scale)
+    if (bounds[2] < window[0] or bounds[0] > window[2] or bounds[3] < window[1] or bounds[1] > window[3]):
+        return
+    _, end = geometry.segment_range(1, level)
+    ox, oy = x * scale - origin[0], y * scale - origin[1]
+    scale *= tree_scale
+
+    def to_tile(px, py):
+        return px * scale + ox, py * scale + oy
+
+    seg = geometry.segments
+    nodes = _intersecting(boxes[:end], window)
+    for node in nodes.tolist():
+        x0, y0, x1, y1, thickness = seg[node].tolist()
+        _draw_thick_segment(tile, BRANCH_PALETTE[geometry.colors[node]], to_tile(x0, y0), to_tile(x1, y1),
+                            max(1, int(thickness * scale)))
+
+    bark_start, bark_end = geometry.bark_range(1, level)
+    bark_color = BRANCH_PALETTE[BARK_COLOR_INDEX]
+    for bx, by in geometry.bark[bark_start:bark_end].tolist():
+        if window[0] - 2 <= bx <= window[2] + 2 and window[1] - 2 <= by <= window[3] + 2:
+            pygame.draw.circle(tile, bark_color, to_tile(bx, by), 2 * scale)
+
+    # Snow caps on the thicker branches, as drawn by TreeLayers
+    for node in nodes.tolist():
+        x0, y0, x1, y1, thickness = seg[node].tolist()
+        color = scene.snow_palette[SNOW_BASE + node % LEAF_SLOTS]
+        if thickness <= 3 or color == TRANSPARENT_KEY:
+            continue
+        snow_size = int(thickness * 0.8)
+        left, top = to_tile((x0 + x1) / 2 - snow_size, min(y0, y1) - 2 - snow_size // 2)
+        pygame.draw.ellipse(tile, color, (left, top, snow_size * 2 * scale, snow_size * scale))
+
+    leaf_start, leaf_end = geometry.leaf_range(1, level)
+    leaves = geometry.leaves[leaf_start:leaf_end]
+    reach = leaves[:, 2] * max(LEAF_RADII)
+    leaf_boxes = np.column_stack([leaves[:, 0] - reach, leaves[:, 1] - reach,
+                                  leaves[:, 0] + reach, leaves[:, 1] + reach])
+    visible = _intersecting(leaf_boxes, window)
+    if not len(visible):
+        return
+    outlines = leaf_polygons(leaves[visible]) * scale + (ox, oy)
+    slots = geometry.leaf_slots[leaf_start:leaf_end][visible].tolist()
+    vein_width = max(1, int(scale))
+    for (lx, ly, size, _), outline, slot in zip(leaves[visible].tolist(), outlines.tolist(), slots):
+        fill = scene.leaf_palette[LEAF_FILL_BASE + slot]
+        if fill == TRANSPARENT_KEY:
+            continue
+        pygame.draw.polygon(tile, fill, outline)
+        pygame.draw.line(tile, scene.leaf_palette[LEAF_VEIN_BASE + slot],
+                         to_tile(lx - size, ly), to_tile(lx + size, ly), vein_width)
+
+
+def render_area(scene, scale, offset_y, rect):
+    """Surface showing the area `rect` of the scene scaled by `scale` (needs no display)"""
+    left, top, width, height = rect
+    tile = pygame.Surface((width, height))
+    origin = (left, top + offset_y)  # Poster pixels to scaled scene pixels
+
+    dark = tuple(max(0, c - 30) for c in scene.sky_color)
+    for row in range(height):
+        t = (origin[1] + row) / scale / SKY_GRADIENT
+        if 0 <= t < 1:
+            color = tuple(int(a + (b - a) * t) for a, b in zip(scene.sky_color, dark))
+        else:
+            color = scene.sky_color
+        tile.fill(color, (0, row, width, 1))
+
+    ground_top = scene.ground_y * scale - origin[1]
+    if ground_top < height:
+        tile.fill(scene.ground_color, (0, max(0, ground_top), width, height))
+    if scene.snowy_ground:
+        pygame.draw.ellipse(tile, (255, 255, 255), (-origin[0], (scene.ground_y - 10) * scale - origin[1],
+                                                    scene.width * scale, 40 * scale))
+
+    for params, x, y, level, tree_scale in scene.trees:
+        if level > 0:
+            _draw_tree(tile, scene, params, x, y, min(level, params.depth), tree_scale, scale, origin)
+    return tile
+
+
+def render_tile(scene, scale, offset_y, rect):
+    """Worker job: rasterize the poster area `rect` and return its zlib-compressed RGB bytes"""
+    return zlib.compress(pygame.image.tobytes(render_area(scene, scale, offset_y, rect), "RGB"), 6)
+
+
+class TiledTiffWriter:
+    """Writes an RGB TIFF one deflate-compressed tile at a time.
+
+    Tiles may arrive in any order; their offsets go into the directory that
+    close() appends at the end of the file. A file that ends up past 4 GiB
+    is written as a BigTIFF, whose 64-bit offsets reach the later tiles.
+    """
+
+    def __init__(self, path, width, height, tile_size=TILE_SIZE):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.tiles_across = -(-width // tile_size)
+        self.tiles_down = -(-height // tile_size)
+        self.offsets = [0] * (self.tiles_across * self.tiles_down)
+        self.byte_counts = [0] * len(self.offsets)
+        self.file = open(path, "wb")
+        # Room for either header; close() writes the one the file needs
+        self.file.write(bytes(16))
+
+    def tile_rects(self):
+        """(index, (left, top, width, height)) of every tile in file order"""
+        for row in range(self.tiles_down):
+            for column in range(self.tiles_across):
+                yield (row * self.tiles_across + column,
+                       (column * self.tile_size, row * self.tile_size, self.tile_size, self.tile_size))
+
+    def write_tile(self, index, data):
+        """Store the zlib-compressed RGB bytes of a full tile"""
+        self.offsets[index] = self.file.tell()
+        self.byte_counts[index] = len(data)
+        self.file.write(data)
+
+    def _append(self, data):
+        if self.file.tell() % 2:
+            self.file.write(b"\0")
+        offset = self.file.tell()
+        self.file.write(data)
+        return offset
+
+    def close(self):
+        count = len(self.offsets)
+        # The tile offsets and the directory after them must fit the offset size
+        big = self.file.tell() + 16 * count + 1024 > 0xFFFFFFFF
+        offset_format, offset_kind = ("Q", 16) if big else ("I", 4)
+        field = struct.calcsize(offset_format)
+
+        def entry(tag, kind, number, data):
+            # Values that do not fit in the entry itself are stored before the directory
+            if len(data) > field:
+                data = struct.pack("<" + offset_format, self._append(data))
+            return struct.pack("<HH" + offset_format, tag, kind, number) + data.ljust(field, b"\0")
+
+        def short(tag, value):
+            return entry(tag, 3, 1, struct.pack("<H", value))
+
+        def long(tag, value):
+            return entry(tag, 4, 1, struct.pack("<I", value))
+
+        resolution = struct.pack("<II", POSTER_DPI, 1)
+        entries = [long(256, self.width), long(257, self.height), entry(258, 3, 3, struct.pack("<3H", 8, 8, 8)),
+                   short(259, 8),  # Deflate
+                   short(262, 2),  # RGB
+                   short(277, 3),
+                   entry(282, 5, 1, resolution), entry(283, 5, 1, resolution),
+                   short(284, 1), short(296, 2),  # Contiguous samples, resolution in inches
+                   long(322, self.tile_size), long(323, self.tile_size),
+                   entry(324, offset_kind, count, struct.pack(f"<{count}{offset_format}", *self.offsets)),
+                   entry(325, 4, count, struct.pack(f"<{count}I", *self.byte_counts))]
+        directory = self._append(struct.pack("<" + ("Q" if big else "H"), len(entries)) + b"".join(entries)
+                                 + bytes(field))
+        self.file.seek(0)
+        if big:
+            self.file.write(b"II" + struct.pack("<HHHQ", 43, 8, 0, directory))
+        else:
+            self.file.write(b"II" + struct.pack("<HI", 42, directory))
+        self.file.close()
+
+
+class PosterExport:
+    """A poster being rendered tile by tile on an executor.
+
+    Call update() regularly (e.g. once per frame); it writes finished tiles
+    and keeps at most `max_pending` tiles in flight.
+    """
+
+    def __init__(self, path, scene, size, executor, tile_size=TILE_SIZE, max_pending=8):
+        width, height = size
+        self.path = path
+        self.scene = scene
+        self.executor = executor
+        self.max_pending = max_pending
+        self.scale = width / scene.width
+        # Keep the ground at the bottom; extra height shows more sky
+        self.offset_y = scene.height * self.scale - height
+        self.writer = TiledTiffWriter(path, width, height, tile_size)
+        self.waiting = list(self.writer.tile_rects())
+        self.waiting.reverse()
+        self.pending = {}  # Future -> tile index
+        self.written = 0
+        self.total = len(self.writer.offsets)
+
+    @property
+    def progress(self):
+        return self.written / self.total
+
+    def update(self, timeout=0):
+        """Write finished tiles and submit more; returns True once the file is complete"""
+        if self.pending:
+            finished, _ = wait(self.pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in finished:
+                self.writer.write_tile(self.pending.pop(future), future.result())
+                self.written += 1
+        while self.waiting and len(self.pending) < self.max_pending:
+            index, rect = self.waiting.pop()
+            future = self.executor.submit(render_tile, self.scene, self.scale, self.offset_y, rect)
+            self.pending[future] = index
+        if self.written == self.total:
+            self.writer.close()
+            return True
+        return False
+
+    def cancel(self):
+        """Stop rendering and delete the unfinished file"""
+        for future in self.pending:
+            future.cancel()
+        self.writer.file.close()
+        os.remove(self.path)
+
+
+def export_poster(path, scene, size, executor, tile_size=TILE_SIZE):
+    """Render `scene` to a tiled TIFF of `size` pixels, blocking until it is written"""
+    export = PosterExport(path, scene, size, executor, tile_size)
+    while not export.update(timeout=None):
+        pass
+    return path
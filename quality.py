@@ -0,0 +1,98 @@
+"""
+Adaptive quality governor that holds a target frame time.
+
+The governor watches how long recent frames took to update and draw (not
+counting the wait in clock.tick) and moves between a few quality levels:
+down as soon as frames run over budget, back up only after a long stretch
+with plenty of headroom. A level that proved too slow right after being
+restored is retried less and less often, so quality does not flicker.
+"""
+from collections import deque, namedtuple
+
+TARGET_FRAME_TIME = 1 / 60
+
+# depth_drop: recursion levels taken off every tree; leaf_density: fraction
+# of leaves shown; falling_leaves, snowflakes: particle caps; grass: blades
+# drawn; bark: bark texture dots on the branches
+QualityLevel = namedtuple("QualityLevel", ["name", "depth_drop", "leaf_density", "falling_leaves",
+                                           "snowflakes", "grass", "bark"])
+
+QUALITY_LEVELS = [
+    QualityLevel("Ultra", 0, 1.0, 80, 150, 150, True),
+    QualityLevel("High", 0, 0.8, 60, 110, 120, True),
+    QualityLevel("Medium", 1, 0.6, 40, 75, 90, False),
+    QualityLevel("Low", 2, 0.45, 20, 40, 60, False),
+    QualityLevel("Minimal", 3, 0.3, 0, 15, 30, False),
+]
+
+SAMPLE_FRAMES = 30     # Frames whose median work time is compared with the target
+OVER_BUDGET = 1.1      # Step down when the median is this far above the target
+HEADROOM = 0.6         # Step up after the median stays below this fraction of it...
+RECOVER_FRAMES = 180   # ...for this many frames (doubled after each failed step up)
+SETTLE_FRAMES = 45     # Frames ignored after a change while trees rebuild
+MAX_BACKOFF = 16
+
+
+class QualityGovernor:
+    """Picks the quality level from recent frame times"""
+
+    def __init__(self, target=TARGET_FRAME_TIME, levels=QUALITY_LEVELS):
+        self.target = target
+        self.levels = levels
+        self.index = 0          # Into levels; 0 is the best quality
+        self.enabled = True
+        self.samples = deque(maxlen=SAMPLE_FRAMES)
+        self.calm_frames = 0    # Frames in a row with headroom
+        self.settle_frames = 0
+        self.backoff = 1
+        self.since_step_up = None  # Frames since quality was last raised
+
+    @property
+    def level(self):
+        return self.levels[self.index]
+
+    def set_enabled(self, enabled):
+        """Turn the governor on or off; off means the best quality, whatever it costs"""
+        self.enabled = enabled
+        if not enabled:
+            self._change(-self.index)
+
+    def set_index(self, index):
+        """Switch straight to levels[index], e.g. when replaying a session; returns True if it changed"""
+        return self._change(index - self.index)
+
+    def update(self, frame_time):
+        """Record the work time of a frame in seconds; returns True if the level changed"""
+        if not self.enabled:
+            return False
+        if self.since_step_up is not None:
+            self.since_step_up += 1
+            if self.since_step_up == RECOVER_FRAMES:
+                self.backoff = 1  # The last step up held
+        if self.settle_frames > 0:
+            self.settle_frames -= 1
+            return False
+        self.samples.append(frame_time)
+        if len(self.samples) < SAMPLE_FRAMES:
+            return False
+        median = sorted(self.samples)[len(self.samples) // 2]
+
+        if median > self.target * OVER_BUDGET and self.index < len(self.levels) - 1:
+            if self.since_step_up is not None and self.since_step_up < RECOVER_FRAMES:
+                # The better level was too slow again; wait longer before the next try
+                self.backoff = min(MAX_BACKOFF, self.backoff * 2)
+            self.since_step_up = None
+            return self._change(1)
+
+        self.calm_frames = self.calm_frames + 1 if median < self.target * HEADROOM else 0
+        if self.calm_frames >= RECOVER_FRAMES * self.backoff and self.index > 0:
+            self.since_step_up = 0
+            return self._change(-1)
+        return False
+
+    def _change(self, step):
+        self.index += step
+        self.samples.clear()
+        self.calm_frames = 0
+        self.settle_frames = SETTLE_FRAMES
+        return step != 0
@@ -0,0 +1,273 @@
+"""
+Local HTTP service that renders tree images on request.
+
+Run `python render_service.py` and fetch e.g.
+
+    http://127.0.0.1:8765/tree.png?seed=42&depth=11&angle=25&season=autumn&width=512&height=512
+
+Every query parameter is optional: seed, depth, trunk, angle (degrees),
+ratio, asymmetry, season, width and height. Images are drawn by the poster
+renderer in a process pool, so the service never opens a window and never
+imports the simulator. Identical requests that arrive while one is being
+rendered wait for that render instead of starting their own, and finished
+PNGs are kept in an LRU cache. GET /stats reports request counts, the cache
+hit rate and latency percentiles as JSON.
+
+Everything runs on localhost with the standard library plus the packages
+the simulator already needs.
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import multiprocessing
+import os
+import time
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import parse_qsl, urlsplit
+
+import pygame
+
+from poster_export import PosterScene, render_area
+from seasons import SEASONS, SKY_COLORS, SeasonBlend
+from tree_geometry import TreeParams, generate_tree_geometry
+
+HOST = "127.0.0.1"
+PORT = 8765
+CACHE_SIZE = 256       # Encoded PNGs kept for repeat requests
+LATENCY_SAMPLES = 1000  # Recent request latencies the percentiles are taken from
+
+MAX_DEPTH = 14
+MAX_SIZE = 4096
+GROUND_HEIGHT = 40   # Scene pixels of ground below the tree
+MARGIN = 20          # Scene pixels between the tree and the image edges
+
+# Everything that decides what an image looks like; the cache key
+RenderRequest = namedtuple("RenderRequest", ["seed", "depth", "trunk_length", "branch_angle",
+                                             "length_ratio", "asymmetry", "season", "width", "height"])
+
+
+def parse_request(query):
+    """RenderRequest from a URL query string; raises ValueError for bad values"""
+    values = dict(parse_qsl(query))
+    request = RenderRequest(seed=int(values.get("seed", 0)),
+                            depth=int(values.get("depth", 10)),
+                            trunk_length=float(values.get("trunk", 120)),
+                            branch_angle=round(math.radians(float(values.get("angle", 30))), 6),
+                            length_ratio=float(values.get("ratio", 0.67)),
+                            asymmetry=float(values.get("asymmetry", 0.15)),
+                            season=values.get("season", "spring"),
+                            width=int(values.get("width", 512)),
+                            height=int(values.get("height", 512)))
+    if not all(math.isfinite(value) for value in (request.trunk_length, request.branch_angle,
+                                                  request.length_ratio, request.asymmetry)):
+        raise ValueError("numbers must be finite")
+    if not 1 <= request.depth <= MAX_DEPTH:
+        raise ValueError(f"depth must be between 1 and {MAX_DEPTH}")
+    if not (1 <= request.width <= MAX_SIZE and 1 <= request.height <= MAX_SIZE):
+        raise ValueError(f"width and height must be between 1 and {MAX_SIZE}")
+    if request.season not in SEASONS:
+        raise ValueError(f"season must be one of {', '.join(SEASONS)}")
+    if not (0 < request.trunk_length <= 1000 and 0 < request.length_ratio < 1):
+        raise ValueError("trunk must be in (0, 1000] and ratio in (0, 1)")
+    return request
+
+
+def render_png(request):
+    """Worker job: the PNG bytes of one fully grown tree, fitted to the requested size"""
+    params = TreeParams(request.seed, request.depth, request.trunk_length, request.branch_angle,
+                        request.length_ratio, request.asymmetry)
+    left, top, right, bottom = generate_tree_geometry(params).bounds()
+    # Scene size that fits the tree with margins and has the image's aspect ratio
+    scale = min(request.width / (right - left + 2 * MARGIN),
+                request.height / (bottom - top + GROUND_HEIGHT + 2 * MARGIN))
+    width, height = request.width / scale, request.height / scale
+    ground_y = height - GROUND_HEIGHT
+    blend = SeasonBlend(request.season)
+    winter = request.season == "winter"
+    scene = PosterScene(width, height, SKY_COLORS[request.season],
+                        (200, 200, 210) if winter else (139, 69, 19), ground_y, winter,
+                        [(params, width / 2 - (left + right) / 2, ground_y, request.depth, 1.0)],
+                        blend.leaf_palette(), blend.snow_palette())
+    image = render_area(scene, scale, 0, (0, 0, request.width, request.height))
+    data = io.BytesIO()
+    pygame.image.save(image, data, "png")
+    return data.getvalue()
+
+
+class RenderService:
+    """Renders, caches and coalesces tree images; independent of the HTTP layer.
+
+    `make_executor`, if given, is called for a new pool when a worker process
+    dies, since a broken ProcessPoolExecutor fails every later job.
+    """
+
+    def __init__(self, executor, cache_size=CACHE_SIZE, make_executor=None):
+        self.executor = executor
+        self.make_executor = make_executor
+        self.cache = OrderedDict()  # RenderRequest -> PNG bytes, least recently used first
+        self.cache_size = cache_size
+        self.in_flight = {}         # RenderRequest -> Future of a render in progress
+        self.requests = 0
+        self.hits = 0
+        self.coalesced = 0
+        self.renders = 0
+        self.errors = 0
+        self.restarts = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)  # Seconds per image request
+        self.started = time.time()
+
+    async def render(self, request):
+        """PNG bytes for `request`, from the cache, a render in flight or a new render"""
+        start = time.perf_counter()
+        self.requests += 1
+        try:
+            png = self.cache.get(request)
+            if png is not None:
+                self.hits += 1
+                self.cache.move_to_end(request)
+                return png
+            future = self.in_flight.get(request)
+            if future is not None:
+                self.coalesced += 1
+            else:
+                self.renders += 1
+                future = self._submit(request)
+                self.in_flight[request] = future
+            # A client giving up must not cancel a render others are waiting for
+            return await asyncio.shield(future)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+    def _submit(self, request):
+        executor = self.executor
+        try:
+            future = asyncio.get_running_loop().run_in_executor(executor, render_png, request)
+        except BrokenProcessPool:
+            self._restart(executor)
+            executor = self.executor
+            future = asyncio.get_running_loop().run_in_executor(executor, render_png, request)
+        future.add_done_callback(lambda done: self._finished(request, done, executor))
+        return future
+
+    def _restart(self, broken):
+        """Replace the pool `broken` unless that happened already"""
+        if self.make_executor is None or self.executor is not broken:
+            return
+        broken.shutdown(wait=False)
+        self.executor = self.make_executor()
+        self.restarts += 1
+
+    def _finished(self, request, future, executor):
+        del self.in_flight[request]
+        error = None if future.cancelled() else future.exception()
+        if future.cancelled() or error is not None:
+            self.errors += 1
+            if isinstance(error, BrokenProcessPool):
+                self._restart(executor)
+            return
+        self.cache[request] = future.result()
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(fraction):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 2)
+
+        return {"requests": self.requests,
+                "cache_hits": self.hits,
+                "coalesced": self.coalesced,
+                "renders": self.renders,
+                "errors": self.errors,
+                "pool_restarts": self.restarts,
+                "hit_rate": round((self.hits + self.coalesced) / self.requests, 4) if self.requests else None,
+                "in_flight": len(self.in_flight),
+                "cached_images": len(self.cache),
+                "cached_bytes": sum(len(png) for png in self.cache.values()),
+                "latency_ms": {"mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+                               "p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99),
+                               "max": percentile(1.0)},
+                "uptime_s": round(time.time() - self.started, 1)}
+
+    async def handle(self, reader, writer):
+        """Answer one HTTP/1.1 request on a connection, then close it"""
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass  # Headers are not needed
+            parts = request_line.decode("latin-1").split()
+            if len(parts) < 2:
+                return
+            method, target = parts[0], urlsplit(parts[1])
+            if method != "GET":
+                await _respond(writer, 405, "text/plain", b"Only GET is supported\n")
+            elif target.path == "/stats":
+                await _respond(writer, 200, "application/json", json.dumps(self.stats(), indent=2).encode())
+            elif target.path == "/tree.png":
+                try:
+                    request = parse_request(target.query)
+                except ValueError as error:
+                    await _respond(writer, 400, "text/plain", f"{error}\n".encode())
+                    return
+                try:
+                    png = await self.render(request)
+                except Exception as error:
+                    await _respond(writer, 500, "text/plain", f"Render failed: {error}\n".encode())
+                    return
+                await _respond(writer, 200, "image/png", png)
+            else:
+                await _respond(writer, 404, "text/plain", b"Try /tree.png or /stats\n")
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            500: "Internal Server Error"}
+
+
+async def _respond(writer, status, content_type, body):
+    writer.write(f"HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Type: {content_type}\r\n"
+                 f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+
+
+def render_executor(workers=None):
+    """Process pool for renders; "spawn" workers only import the render modules"""
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 2) - 1)
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+async def serve(host=HOST, port=PORT, workers=None, cache_size=CACHE_SIZE):
+    """Run the service until cancelled"""
+    service = RenderService(render_executor(workers), cache_size, lambda: render_executor(workers))
+    try:
+        server = await asyncio.start_server(service.handle, host, port)
+        print(f"Serving tree images on http://{host}:{server.sockets[0].getsockname()[1]}/tree.png")
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.executor.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render tree images over HTTP")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache", type=int, default=CACHE_SIZE, help="PNGs kept in memory")
+    arguments = parser.parse_args()
+    try:
+        asyncio.run(serve(arguments.host, arguments.port, arguments.workers, arguments.cache))
+    except KeyboardInterrupt:
+        pass
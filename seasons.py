@@ -0,0 +1,158 @@
+"""
+Seasonal leaf palettes and smooth transitions between them.
+
+Leaf and snow sprites are rasterized once with palette indices instead of
+colors (see tree_render.py). Changing season therefore never touches tree
+geometry: a blended palette is built from lookup tables prepared at import
+time and swapped into every cached sprite.
+"""
+import numpy as np
+
+from tree_geometry import LEAF_SLOTS
+
+# Leaf colors for different seasons
+SPRING_LEAVES = [(144, 238, 144), (152, 251, 152), (124, 252, 0), (173, 255, 47), (186, 255, 201)]
+SUMMER_LEAVES = [(34, 139, 34), (0, 128, 0), (0, 100, 0), (46, 139, 87), (60, 179, 113)]
+AUTUMN_LEAVES = [(255, 140, 0), (255, 69, 0), (255, 99, 71), (178, 34, 34), (139, 69, 19), (205, 92, 0),
+                 (255, 165, 0), (255, 127, 80), (210, 105, 30), (160, 82, 45), (218, 165, 32),
+                 (184, 134, 11), (189, 83, 107), (205, 133, 63), (244, 164, 96)]  # Expanded palette
+SNOW_COLORS = [(255, 255, 255), (240, 248, 255), (230, 230, 250)]
+
+SEASONS = ["spring", "summer", "autumn", "winter"]
+SKY_COLORS = {"spring": (135, 206, 235), "summer": (100, 149, 237),
+              "autumn": (255, 200, 150), "winter": (200, 220, 240)}
+SEASON_TRANSITION_TIME = 2.0  # Seconds for a full season change
+TRANSITION_STEPS = 12         # Palette updates per transition
+
+# Palette layout of leaf and snow sprites: 0 is transparent, then one fill
+# and one vein entry per slot
+TRANSPARENT_KEY = (255, 0, 255)
+LEAF_FILL_BASE = 1
+LEAF_VEIN_BASE = 1 + LEAF_SLOTS
+SNOW_BASE = 1
+
+# Order in which slots drop their leaves (and gather snow) going into winter;
+# 37 is coprime with LEAF_SLOTS so this visits every slot once
+SLOT_FADE_ORDER = (np.arange(LEAF_SLOTS) * 37) % LEAF_SLOTS
+
+
+def leaf_lookup_table(palette):
+    """256-entry RGB table mapping leaf sprite indices to `palette` colors"""
+    table = np.zeros((256, 3), np.float32)
+    slots = np.arange(LEAF_SLOTS)
+    colors = np.array(palette, np.float32)[slots * len(palette) // LEAF_SLOTS]
+    table[LEAF_FILL_BASE:LEAF_FILL_BASE + LEAF_SLOTS] = colors
+    table[LEAF_VEIN_BASE:LEAF_VEIN_BASE + LEAF_SLOTS] = np.maximum(colors - 30, 0)
+    return table
+
+
+# One table per leafy season (winter has no leaves of its own)
+LEAF_TABLES = np.stack([leaf_lookup_table(SPRING_LEAVES),
+                        leaf_lookup_table(SUMMER_LEAVES),
+                        leaf_lookup_table(AUTUMN_LEAVES)])
+
+
+def season_weights(season):
+    weights = np.zeros(len(SEASONS))
+    weights[SEASONS.index(season)] = 1.0
+    return weights
+
+
+def _to_palette(table):
+    return [tuple(color) for color in table.tolist()]
+
+
+class SeasonBlend:
+    """Time-based blend of leaf colors, leaf cover and snow towards a target season"""
+
+    def __init__(self, season, duration=SEASON_TRANSITION_TIME):
+        self.duration = duration
+        self.target = season
+        self.progress = 1.0  # 0 to 1 through the current transition
+        self.weights = season_weights(season)
+        self.start_weights = self.weights
+        self.version = 0  # Bumped whenever the palettes change
+        self.leaf_density = 1.0  # Fraction of leaf slots shown at full leaf cover
+        self._step = TRANSITION_STEPS
+        self._leaf_palette = None
+        self._snow_palette = None
+
+    @property
+    def settled(self):
+        return self.progress >= 1.0
+
+    def set_target(self, season):
+        """Start blending from the current mix towards `season`"""
+        if season == self.target:
+            return
+        self.target = season
+        self.start_weights = self.weights
+        self.progress = 0.0
+        self._step = 0
+
+    def update(self, time_delta):
+        """Advance the transition; returns True if the palettes changed"""
+        if self.settled:
+            return False
+        self.progress = min(1.0, self.progress + time_delta / self.duration)
+        step = int(self.progress * TRANSITION_STEPS)
+        if step == self._step:
+            return False
+        self._step = step
+        t = step / TRANSITION_STEPS
+        t = t * t * (3 - 2 * t)  # Smoothstep
+        self.weights = self.start_weights + (season_weights(self.target) - self.start_weights) * t
+        self.version += 1
+        self._leaf_palette = None
+        self._snow_palette = None
+        return True
+
+    def set_leaf_density(self, density):
+        """Show only a fraction of the leaves, e.g. to draw less on slow hardware"""
+        if density != self.leaf_density:
+            self.leaf_density = density
+            self.version += 1
+            self._leaf_palette = None
+
+    @property
+    def leaf_cover(self):
+        """Fraction of leaves still on the trees"""
+        return 1.0 - self.weights[3]
+
+    @property
+    def snow_cover(self):
+        """Fraction of snow caps on the branches"""
+        return self.weights[3]
+
+    def _visible_slots(self, cover):
+        return SLOT_FADE_ORDER < int(round(cover * LEAF_SLOTS))
+
+    def leaf_palette(self, density=None):
+        """Blended 256-entry palette for leaf sprites; `density` overrides leaf_density (e.g. 1.0 for exports)"""
+        if density is not None and density != self.leaf_density:
+            return self._make_leaf_palette(density)
+        if self._leaf_palette is None:
+            self._leaf_palette = self._make_leaf_palette(self.leaf_density)
+        return self._leaf_palette
+
+    def _make_leaf_palette(self, density):
+        leafy = self.weights[:3]
+        total = leafy.sum()
+        # Deep winter: no leaves are visible, keep the autumn colors
+        leafy = leafy / total if total > 1e-6 else np.array([0.0, 0.0, 1.0])
+        table = np.rint(np.tensordot(leafy, LEAF_TABLES, axes=1)).astype(np.uint8)
+        table[0] = TRANSPARENT_KEY
+        hidden = ~self._visible_slots(self.leaf_cover * density)
+        table[LEAF_FILL_BASE:LEAF_FILL_BASE + LEAF_SLOTS][hidden] = TRANSPARENT_KEY
+        table[LEAF_VEIN_BASE:LEAF_VEIN_BASE + LEAF_SLOTS][hidden] = TRANSPARENT_KEY
+        return _to_palette(table)
+
+    def snow_palette(self):
+        """256-entry palette for snow sprites"""
+        if self._snow_palette is None:
+            table = np.zeros((256, 3), np.uint8)
+            table[:] = TRANSPARENT_KEY
+            visible = self._visible_slots(self.snow_cover)
+            table[SNOW_BASE:SNOW_BASE + LEAF_SLOTS][visible] = (255, 255, 255)
+            self._snow_palette = _to_palette(table)
+        return self._snow_palette
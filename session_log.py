@@ -0,0 +1,192 @@
+"""
+Recording of input sessions and deterministic replay.
+
+A recorded session is a gzip-compressed stream of small binary records: the
+random seed the session started with, then the input the main loop handled,
+by frame number. Recorded are the time step of every frame (everything that
+moves or fades is advanced by it), key presses, mouse clicks, slider moves
+(by slider, not by widget object), the arrow keys held for scrolling and
+changes of the quality level.
+
+Replaying feeds the same input back on the same frames with the same time
+steps, but as fast as frames can be made, and records how long every frame
+took. With the same seed, the same input and the same steps a build draws
+the same frames as the recorded session, so the frame-time traces and
+final-frame hashes of two builds can be compared directly.
+"""
+import gzip
+import hashlib
+import os
+import random
+import struct
+import time
+
+import numpy as np
+import pygame
+import pygame_gui
+
+SESSION_DIR = "sessions"
+
+HELD_KEYS = (pygame.K_LEFT, pygame.K_RIGHT)  # Keys whose held state is recorded every frame
+
+_MAGIC = b"TRS2"
+_HEADER = struct.Struct("<4sIH")  # Magic, seed, target frames per second
+_RECORD = struct.Struct("<IB")    # Frame, kind
+
+# Kinds of record and the layout of what follows them
+_QUIT, _KEY, _CLICK, _SLIDER, _HELD, _QUALITY, _END, _STEP = range(8)
+_PAYLOADS = {_QUIT: struct.Struct("<"), _KEY: struct.Struct("<iH"), _CLICK: struct.Struct("<hhB"),
+             _SLIDER: struct.Struct("<Bd"), _HELD: struct.Struct("<B"), _QUALITY: struct.Struct("<B"),
+             _END: struct.Struct("<"), _STEP: struct.Struct("<d")}
+
+
+def seed_random(seed):
+    """Seed every random number generator the simulator uses"""
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def new_session_seed():
+    return random.randrange(2 ** 32)
+
+
+def session_path():
+    """Timestamped file name for a new recording"""
+    os.makedirs(SESSION_DIR, exist_ok=True)
+    return os.path.join(SESSION_DIR, f"session_{time.strftime('%Y%m%d_%H%M%S')}.trs")
+
+
+def frame_hash(surface):
+    """SHA-256 of the pixels of `surface`, e.g. the last frame of a replay"""
+    return hashlib.sha256(pygame.image.tobytes(surface, "RGB")).hexdigest()
+
+
+def _held_mask(held):
+    return sum(1 << bit for bit, key in enumerate(HELD_KEYS) if key in held)
+
+
+class SessionRecorder:
+    """Writes the input of a running session to `path`.
+
+    `sliders` are the slider widgets in a fixed order; a slider move is
+    recorded as the slider's position in that list.
+    """
+
+    def __init__(self, path, seed, fps, sliders):
+        self.path = path
+        self.sliders = list(sliders)
+        self.file = gzip.open(path, "wb")
+        self.file.write(_HEADER.pack(_MAGIC, seed, fps))
+        self.time_delta = None  # Time step last recorded
+        self.held = 0
+        self.level = 0  # Quality level last recorded
+
+    def _write(self, frame, kind, *values):
+        self.file.write(_RECORD.pack(frame, kind) + _PAYLOADS[kind].pack(*values))
+
+    def frame(self, frame, time_delta, events, held):
+        """Record the time step of `frame`, the events handled in it and the keys held during it"""
+        if time_delta != self.time_delta:
+            self._write(frame, _STEP, time_delta)
+            self.time_delta = time_delta
+        mask = _held_mask(held)
+        if mask != self.held:
+            self._write(frame, _HELD, mask)
+            self.held = mask
+        for event in events:
+            if event.type == pygame.QUIT:
+                self._write(frame, _QUIT)
+            elif event.type == pygame.KEYDOWN:
+                self._write(frame, _KEY, event.key, event.mod)
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                self._write(frame, _CLICK, *event.pos, event.button)
+            elif event.type == pygame_gui.UI_HORIZONTAL_SLIDER_MOVED and event.ui_element in self.sliders:
+                self._write(frame, _SLIDER, self.sliders.index(event.ui_element), event.value)
+
+    def quality(self, frame, index):
+        """Record the quality level in use at the end of `frame` if it changed"""
+        if index != self.level:
+            self._write(frame, _QUALITY, index)
+            self.level = index
+
+    def close(self, frames):
+        self._write(frames, _END)
+        self.file.close()
+
+
+class SessionReplay:
+    """A recorded session, handed back one frame at a time"""
+
+    def __init__(self, path, sliders):
+        with gzip.open(path, "rb") as file:
+            data = bytearray()
+            try:
+                while chunk := file.read(1 << 16):
+                    data += chunk
+            except EOFError:
+                pass  # The recording was cut off; replay what was written
+        magic, self.seed, self.fps = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a recorded session")
+        self.path = path
+        self.sliders = list(sliders)
+        self.records = {}  # Frame -> [(kind, values)] in recorded order
+        self.frames = 0    # Number of frames the session ran for
+        offset = _HEADER.size
+        while offset + _RECORD.size <= len(data):
+            frame, kind = _RECORD.unpack_from(data, offset)
+            payload = _PAYLOADS[kind]
+            if offset + _RECORD.size + payload.size > len(data):
+                break
+            values = payload.unpack_from(data, offset + _RECORD.size)
+            offset += _RECORD.size + payload.size
+            self.records.setdefault(frame, []).append((kind, values))
+            self.frames = max(self.frames, frame + 1 if kind != _END else frame)
+        self.time_delta = 1 / self.fps
+        self.held = set()
+        self.quality = None  # Quality level recorded for the current frame, if any
+        self.times = []      # (work seconds, quality level) of every replayed frame
+
+    def frame(self, frame):
+        """Events, held keys and time step of `frame`; sliders are moved to their recorded values"""
+        events = []
+        self.quality = None
+        for kind, values in self.records.get(frame, ()):
+            if kind == _QUIT:
+                events.append(pygame.event.Event(pygame.QUIT))
+            elif kind == _KEY:
+                key, mod = values
+                events.append(pygame.event.Event(pygame.KEYDOWN, key=key, mod=mod))
+            elif kind == _CLICK:
+                x, y, button = values
+                events.append(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(x, y), button=button))
+            elif kind == _SLIDER:
+                slider, value = self.sliders[values[0]], values[1]
+                slider.set_current_value(value)
+                events.append(pygame.event.Event(pygame_gui.UI_HORIZONTAL_SLIDER_MOVED,
+                                                 ui_element=slider, value=value))
+            elif kind == _HELD:
+                self.held = {key for bit, key in enumerate(HELD_KEYS) if values[0] >> bit & 1}
+            elif kind == _QUALITY:
+                self.quality = values[0]
+            elif kind == _STEP:
+                self.time_delta = values[0]
+        return events, self.held, self.time_delta
+
+    def report(self, trace_path=None):
+        """Print a frame-time summary and optionally write every frame time as CSV"""
+        if trace_path:
+            with open(trace_path, "w") as trace:
+                trace.write("frame,work_ms,quality\n")
+                for frame, (seconds, level) in enumerate(self.times):
+                    trace.write(f"{frame},{seconds * 1000:.3f},{level}\n")
+        if not self.times:
+            return
+        work = sorted(seconds * 1000 for seconds, _ in self.times)
+
+        def percentile(fraction):
+            return work[min(len(work) - 1, int(fraction * len(work)))]
+
+        print(f"Replayed {len(work)} frames of {self.path}: mean {sum(work) / len(work):.2f} ms, "
+              f"p50 {percentile(0.5):.2f} ms, p95 {percentile(0.95):.2f} ms, "
+              f"p99 {percentile(0.99):.2f} ms, max {work[-1]:.2f} ms")
@@ -0,0 +1,98 @@
+"""
+Offline tests of the render service over a real localhost socket.
+
+Renders run in a thread pool so the tests stay quick; run with
+`python -m pytest test_render_service.py` (or `python -m unittest`).
+"""
+import asyncio
+import json
+import os
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from render_service import RenderService, parse_request
+
+QUERY = "seed=7&depth=6&width=64&height=64"
+
+
+async def fetch(port, target):
+    """Status code and body of a GET to the service"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), body
+
+
+class BrokenExecutor:
+    """Fails like a process pool whose worker died"""
+
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool("a worker died")
+
+    def shutdown(self, wait=True):
+        pass
+
+
+class RenderServiceTest(unittest.TestCase):
+
+    def serve(self, service, client):
+        """Run `client(port)` against `service` on a free localhost port"""
+        async def main():
+            server = await asyncio.start_server(service.handle, "127.0.0.1", 0)
+            async with server:
+                return await client(server.sockets[0].getsockname()[1])
+        return asyncio.run(main())
+
+    def test_coalesces_caches_and_reports(self):
+        with ThreadPoolExecutor(2) as executor:
+            service = RenderService(executor)
+
+            async def client(port):
+                first = await asyncio.gather(*(fetch(port, f"/tree.png?{QUERY}") for _ in range(8)))
+                again = await fetch(port, f"/tree.png?{QUERY}")
+                stats = await fetch(port, "/stats")
+                return first, again, stats
+
+            first, again, (status, body) = self.serve(service, client)
+        self.assertTrue(all(code == 200 and png.startswith(b"\x89PNG") for code, png in first))
+        self.assertEqual(again, first[0])
+        stats = json.loads(body)
+        self.assertEqual(status, 200)
+        self.assertEqual(stats["requests"], 9)
+        self.assertEqual(stats["renders"], 1)
+        self.assertEqual(stats["coalesced"], 7)
+        self.assertEqual(stats["cache_hits"], 1)
+        self.assertEqual(stats["cached_images"], 1)
+
+    def test_bad_requests(self):
+        with ThreadPoolExecutor(1) as executor:
+            service = RenderService(executor)
+
+            async def client(port):
+                return [(await fetch(port, target))[0] for target in
+                         ("/tree.png?angle=nan", "/tree.png?asymmetry=inf", "/tree.png?depth=99", "/nothing")]
+
+            self.assertEqual(self.serve(service, client), [400, 400, 400, 404])
+        with self.assertRaises(ValueError):
+            parse_request("trunk=nan")
+
+    def test_replaces_a_broken_pool(self):
+        with ThreadPoolExecutor(1) as executor:
+            service = RenderService(BrokenExecutor(), make_executor=lambda: executor)
+
+            async def client(port):
+                return await fetch(port, f"/tree.png?{QUERY}")
+
+            status, _ = self.serve(service, client)
+        self.assertEqual(status, 200)
+        self.assertEqual(service.restarts, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
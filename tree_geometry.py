@@ -0,0 +1,200 @@
+"""
+Vectorized branch geometry for the recursive tree.
+
+Instead of recursing once per branch, the tree is built one level at a time
+with NumPy: every branch of a level is computed from its parent level in a
+handful of array operations. Branches are stored in heap order (the children
+of branch i are 2i + 1 and 2i + 2), so each level is a contiguous slice.
+"""
+import math
+from collections import namedtuple
+
+import numpy as np
+
+# Everything that changes the shape of a tree; used as a cache key. `bark`
+# turns the bark texture dots on or off.
+TreeParams = namedtuple("TreeParams", ["seed", "depth", "trunk_length",
+                                       "branch_angle", "length_ratio", "asymmetry", "bark"],
+                        defaults=[True])
+
+# Branch colors are stored as indices into this palette (index 0 is transparent)
+TRUNK_COLOR_BASE = 1   # (b, b - 30, b - 60) for b in 90..110
+TWIG_COLOR_BASE = 22   # (139, 90 + v, 43) for v in -10..10
+BARK_COLOR_INDEX = 43
+BRANCH_PALETTE = ([(0, 0, 0)]
+                  + [(b, b - 30, b - 60) for b in range(90, 111)]
+                  + [(139, 90 + v, 43) for v in range(-10, 11)]
+                  + [(80, 50, 20)])
+
+# Leaves grow on the last three levels of the tree
+LEAF_LEVELS = 3
+# Each leaf picks one of these slots; the season palette maps slots to colors
+LEAF_SLOTS = 60
+
+# Radius multipliers for the 8 points of a leaf, starting at its tip
+LEAF_RADII = (1.5, 0.8, 0.4, 0.8, 1.5, 0.8, 0.4, 0.8)
+
+# Independent random streams drawn for every branch
+_ASYMMETRY, _BROWN, _TWIG, _LENGTH, _THICKNESS = range(5)
+_BARK_FIRST, _BARK_SECOND = 5, 6
+_LEAF_SLOT, _LEAF_SIZE, _LEAF_ROTATION = 7, 8, 9
+
+_MASK64 = (1 << 64) - 1
+
+
+def node_random(seed, nodes, stream):
+    """Deterministic uniform [0, 1) value for every branch index in `nodes`"""
+    offset = (seed * 0x9E3779B97F4A7C15 + stream * 0xD1B54A32D192ED03) & _MASK64
+    z = nodes.astype(np.uint64) * np.uint64(0xBF58476D1CE4E5B9) + np.uint64(offset)
+    # splitmix64 finalizer
+    z ^= z >> np.uint64(30)
+    z *= np.uint64(0xBF58476D1CE4E5B9)
+    z ^= z >> np.uint64(27)
+    z *= np.uint64(0x94D049BB133111EB)
+    z ^= z >> np.uint64(31)
+    return (z >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+
+def level_range(level):
+    """Branch indices [start, end) of a level (1 = trunk)"""
+    return (1 << (level - 1)) - 1, (1 << level) - 1
+
+
+class TreeGeometry:
+    """Flat arrays describing every branch, leaf and bark mark of one tree.
+
+    Coordinates are relative to the base of the trunk, with y pointing down.
+    """
+
+    def __init__(self, params, segments, colors, leaves, leaf_slots, bark, bark_nodes):
+        self.params = params
+        self.depth = params.depth
+        self.segments = segments        # float32 (n, 5): x0, y0, x1, y1, thickness
+        self.colors = colors            # uint8 (n,): index into BRANCH_PALETTE
+        self.leaves = leaves            # float32 (m, 4): x, y, size, rotation
+        self.leaf_slots = leaf_slots    # uint8 (m,)
+        self.bark = bark                # float32 (k, 2): bark dot centers
+        self.bark_nodes = bark_nodes    # int32 (k,): branch each dot belongs to
+        self.leaf_start = len(segments) - len(leaves)
+        self._bounds = {}
+
+    def segment_range(self, first_level, last_level):
+        """Branch indices [start, end) covering levels first_level..last_level"""
+        last_level = min(last_level, self.depth)
+        if last_level < first_level:
+            return 0, 0
+        return level_range(first_level)[0], level_range(last_level)[1]
+
+    def leaf_range(self, first_level, last_level):
+        """Leaf indices [start, end) grown on levels first_level..last_level"""
+        start, end = self.segment_range(first_level, last_level)
+        start = max(start, self.leaf_start) - self.leaf_start
+        end = max(end, self.leaf_start) - self.leaf_start
+        return start, end
+
+    def bark_range(self, first_level, last_level):
+        """Bark dot indices [start, end) on levels first_level..last_level"""
+        start, end = self.segment_range(first_level, last_level)
+        return (int(np.searchsorted(self.bark_nodes, start)),
+                int(np.searchsorted(self.bark_nodes, end)))
+
+    def bounds(self, padding=0):
+        """Integer (left, top, right, bottom) box enclosing the whole tree"""
+        if padding not in self._bounds:
+            self._bounds[padding] = self._measure_bounds(padding)
+        return self._bounds[padding]
+
+    def _measure_bounds(self, padding):
+        seg = self.segments
+        half = seg[:, 4] / 2
+        xs = np.concatenate([seg[:, 0] - half, seg[:, 2] - half, seg[:, 0] + half, seg[:, 2] + half])
+        ys = np.concatenate([seg[:, 1] - half, seg[:, 3] - half, seg[:, 1] + half, seg[:, 3] + half])
+        if len(self.leaves):
+            reach = self.leaves[:, 2] * max(LEAF_RADII)
+            xs = np.concatenate([xs, self.leaves[:, 0] - reach, self.leaves[:, 0] + reach])
+            ys = np.concatenate([ys, self.leaves[:, 1] - reach, self.leaves[:, 1] + reach])
+        return (int(math.floor(xs.min())) - padding, int(math.floor(ys.min())) - padding,
+                int(math.ceil(xs.max())) + padding, int(math.ceil(ys.max())) + padding)
+
+
+def generate_tree_geometry(params):
+    """Build the full branch structure for `params` one level at a time"""
+    seed, depth, trunk_length, branch_angle, length_ratio, asymmetry, with_bark = params
+    count = (1 << depth) - 1
+    segments = np.empty((count, 5), np.float32)
+    colors = np.empty(count, np.uint8)
+
+    # State of the branches on the current level
+    x = np.zeros(1)
+    y = np.zeros(1)
+    length = np.array([float(trunk_length)])
+    angle = np.array([-math.pi / 2])
+    thickness = np.array([12 * (trunk_length / 120)])
+
+    for level in range(1, depth + 1):
+        start, end = level_range(level)
+        nodes = np.arange(start, end)
+        end_x = x + length * np.cos(angle)
+        end_y = y + length * np.sin(angle)
+        segments[start:end, 0] = x
+        segments[start:end, 1] = y
+        segments[start:end, 2] = end_x
+        segments[start:end, 3] = end_y
+        segments[start:end, 4] = thickness
+
+        # Thick branches are dark brown, thin ones lighter with a hint of green
+        brown = np.minimum(node_random(seed, nodes, _BROWN) * 21, 20).astype(np.uint8)
+        twig = np.minimum(node_random(seed, nodes, _TWIG) * 21, 20).astype(np.uint8)
+        colors[start:end] = np.where(thickness > 5, TRUNK_COLOR_BASE + brown, TWIG_COLOR_BASE + twig)
+
+        if level == depth:
+            break
+
+        # Children: the left branch bends by the asymmetry, the right one by half of it
+        asymmetry_offset = (node_random(seed, nodes, _ASYMMETRY) * 2 - 1) * asymmetry
+        new_length = length * length_ratio * (0.95 + 0.1 * node_random(seed, nodes, _LENGTH))
+        new_thickness = thickness * (0.65 + 0.1 * node_random(seed, nodes, _THICKNESS))
+        left_angle = angle - branch_angle * (1 + asymmetry_offset)
+        right_angle = angle + branch_angle * (1 - asymmetry_offset * 0.5)
+
+        x = np.repeat(end_x, 2)
+        y = np.repeat(end_y, 2)
+        angle = np.column_stack([left_angle, right_angle]).ravel()
+        length = np.column_stack([new_length, new_length * 0.95]).ravel()
+        thickness = np.repeat(new_thickness, 2)
+
+    # Leaves sit at the tips of the last LEAF_LEVELS levels
+    leaf_start = level_range(max(1, depth - LEAF_LEVELS + 1))[0]
+    leaf_nodes = np.arange(leaf_start, count)
+    leaves = np.empty((len(leaf_nodes), 4), np.float32)
+    leaves[:, 0] = segments[leaf_start:, 2]
+    leaves[:, 1] = segments[leaf_start:, 3]
+    leaves[:, 2] = 5 + np.minimum(node_random(seed, leaf_nodes, _LEAF_SIZE) * 6, 5).astype(np.int32)
+    leaves[:, 3] = node_random(seed, leaf_nodes, _LEAF_ROTATION) * 360
+    leaf_slots = np.minimum(node_random(seed, leaf_nodes, _LEAF_SLOT) * LEAF_SLOTS,
+                            LEAF_SLOTS - 1).astype(np.uint8)
+
+    # Two bark texture dots along every thick branch
+    thick_nodes = np.nonzero((segments[:, 4] > 8) & with_bark)[0].astype(np.int32)
+    bark_nodes = np.repeat(thick_nodes, 2)
+    along = np.where(np.arange(len(bark_nodes)) % 2 == 0,
+                     node_random(seed, bark_nodes, _BARK_FIRST),
+                     node_random(seed, bark_nodes, _BARK_SECOND))
+    seg = segments[bark_nodes]
+    bark = np.empty((len(bark_nodes), 2), np.float32)
+    bark[:, 0] = seg[:, 0] + along * (seg[:, 2] - seg[:, 0])
+    bark[:, 1] = seg[:, 1] + along * (seg[:, 3] - seg[:, 1])
+
+    return TreeGeometry(params, segments, colors, leaves, leaf_slots, bark, bark_nodes)
+
+
+def leaf_polygons(leaves):
+    """(m, 8, 2) outline points for every leaf row of x, y, size, rotation"""
+    steps = np.radians(np.arange(8) * 45.0)
+    radii = np.array(LEAF_RADII)
+    rad = np.radians(leaves[:, 3:4].astype(np.float64)) + steps
+    r = leaves[:, 2:3] * radii
+    points = np.empty((len(leaves), 8, 2))
+    points[:, :, 0] = leaves[:, 0:1] + r * np.cos(rad)
+    points[:, :, 1] = leaves[:, 1:2] + r * np.sin(rad)
+    return points
@@ -0,0 +1,85 @@
+"""
+Geometry instancing for trees that share a shape.
+
+Trunk length only scales a tree, so every tree is built at REFERENCE_TRUNK
+and its sprites are scaled when drawn. Trees with the same seed and branch
+parameters then share their TreeLayers (geometry plus sprites) and their
+background builds, so forests cost memory and build time per unique shape
+rather than per tree. Entries disappear once no tree refers to them, apart
+from the most recently drawn ones, which stay cached up to a fixed count so
+trees scrolling back into view find them again.
+"""
+import random
+import weakref
+from collections import OrderedDict
+
+from tree_geometry import TreeParams, generate_tree_geometry
+
+REFERENCE_TRUNK = 120
+SCALE_STEP = 0.05  # Sprite scales are rounded to this, so scaled copies are shared too
+
+SEED_POOL_SIZE = 8
+
+SPRITE_CACHE_SIZE = 128  # Recently drawn layers kept after their trees page out
+
+
+def instance_params(seed, depth, trunk_length, branch_angle, length_ratio, asymmetry, bark=True):
+    """Shared shape of a tree and the scale its sprites are drawn at"""
+    scale = max(SCALE_STEP, round(trunk_length / REFERENCE_TRUNK / SCALE_STEP) * SCALE_STEP)
+    return TreeParams(seed, depth, REFERENCE_TRUNK, branch_angle, length_ratio, asymmetry, bark), round(scale, 2)
+
+
+def seed_pool(size=SEED_POOL_SIZE):
+    """A few seeds for forests that deliberately reuse geometry"""
+    return [random.randint(0, 10000) for _ in range(size)]
+
+
+class InstanceCache:
+    """Layers and background builds shared between trees of the same shape.
+
+    Layers are keyed by shape and grown level. Once shared they are never
+    drawn into again; a tree that grows further continues on a copy, which
+    trees growing in step then share in turn.
+    """
+
+    def __init__(self, store=None, recent_size=SPRITE_CACHE_SIZE):
+        self.layers = weakref.WeakValueDictionary()  # (TreeParams, level) -> TreeLayers
+        self.builds = weakref.WeakValueDictionary()  # (TreeParams, level) -> GeometryBuild
+        self.store = store  # GeometryStore new geometry is loaded from, if any
+        self.recent = OrderedDict()  # (TreeParams, level) -> TreeLayers, least recently drawn first
+        self.recent_size = recent_size
+
+    def geometry(self, params):
+        """Geometry of `params`, from the store when there is one"""
+        if self.store is not None:
+            return self.store.load(params)
+        return generate_tree_geometry(params)
+
+    def find(self, params, level):
+        """Layers of `params` grown to exactly `level`, if some tree has them"""
+        return self.layers.get((params, level))
+
+    def share(self, layers):
+        """Offer `layers` to other trees; returns the shared layers for their shape and level"""
+        shared = self.layers.setdefault((layers.geometry.params, layers.drawn_level), layers)
+        shared.shared = True
+        return shared
+
+    def build(self, params, level, pool):
+        """Background build of `params` up to `level`, started once for all trees asking"""
+        build = self.builds.get((params, level))
+        if build is None or build.cancelled:
+            build = pool.submit(params, level)
+            self.builds[(params, level)] = build
+        return build
+
+    def keep(self, layers):
+        """Note that shared `layers` were just drawn, evicting the least recently drawn"""
+        key = (layers.geometry.params, layers.drawn_level)
+        self.recent[key] = layers
+        self.recent.move_to_end(key)
+        if len(self.recent) > self.recent_size:
+            self.recent.popitem(last=False)
+
+    def __len__(self):
+        return len(self.layers)
@@ -0,0 +1,317 @@
+"""
+Cached sprite layers for tree geometry.
+
+Each tree is rasterized once into three 8-bit indexed sprites: branches,
+snow and leaves. Leaves and snow are drawn with palette indices (one per
+slot), so a season change only swaps the sprite palettes and never redraws
+a leaf. What actually gets blitted every frame is a display-format copy of
+each sprite, refreshed only when its content or palette changes.
+"""
+import math
+import zlib
+
+import numpy as np
+import pygame
+
+from seasons import LEAF_FILL_BASE, LEAF_VEIN_BASE, SNOW_BASE, TRANSPARENT_KEY
+from tree_geometry import BARK_COLOR_INDEX, BRANCH_PALETTE, LEAF_SLOTS, leaf_polygons
+
+# Room around the geometry bounds for snow caps and line ends
+LAYER_PADDING = 8
+
+# How far the top of a tree leans per unit of wind, relative to its height
+WIND_BEND = 0.04
+SWAY_STRIPS = 24
+
+# Work allowed per frame across all trees (see FrameBudget)
+RECOLOR_BUDGET = 16           # Trees recolored during a season change
+REBUILD_BUDGET = 12           # Background rebuilds swapped in
+RASTER_SEGMENT_BUDGET = 4000  # Branches baked into layers as trees grow
+TIP_SEGMENT_BUDGET = 1 << 12  # Partly grown branches drawn straight to the screen (a level at depth 13)
+PREVIEW_BUDGET = 5            # Reduced-depth previews rebuilt while a slider is dragged
+
+
+class FrameBudget:
+    """Work allowance shared by every tree drawn in one frame.
+
+    Trees that run out keep their previous look for a frame or two instead of
+    stalling the frame, e.g. when a whole forest reaches a new level at once.
+    """
+
+    def __init__(self, recolors=RECOLOR_BUDGET, rebuilds=REBUILD_BUDGET,
+                 raster_segments=RASTER_SEGMENT_BUDGET, tip_segments=TIP_SEGMENT_BUDGET,
+                 previews=PREVIEW_BUDGET):
+        self.recolors = recolors
+        self.rebuilds = rebuilds
+        self.raster_segments = raster_segments
+        self.tip_segments = tip_segments
+        self.previews = previews
+
+
+def indexed_surface(size, palette):
+    """Transparent 8-bit surface using `palette` (index 0 is the colorkey)"""
+    surface = pygame.Surface(size, 0, 8)  # New surfaces start out as index 0
+    surface.set_palette(palette)
+    surface.set_colorkey(0)
+    return surface
+
+
+def _indexed_from_bytes(pixels, size, palette):
+    surface = pygame.image.frombytes(pixels, size, "P")
+    surface.set_palette(palette)
+    surface.set_colorkey(0)
+    return surface
+
+
+def rasterize_layer_data(geometry, level):
+    """Rasterize `geometry` up to `level` and return it in TreeLayers.to_data() form.
+
+    Needs no display, so it can run in a worker process.
+    """
+    layers = TreeLayers(geometry)
+    layers.grow_to(level)
+    return layers.to_data()
+
+
+def display_copy(surface):
+    """Display-format copy of an indexed sprite, keyed on its palette entry 0.
+
+    Palette entries sharing the color of entry 0 become transparent too,
+    which is how leaves and snow caps are hidden without redrawing them.
+    """
+    copy = surface.convert()
+    copy.set_colorkey(surface.get_palette_at(0)[:3], pygame.RLEACCEL)
+    return copy
+
+
+def blit_swayed(screen, surface, pos, root_y, sway):
+    """Blit `surface` bent sideways so the row at its top moves by `sway` pixels.
+
+    The bend grows with the square of the height above `root_y`, so the trunk
+    stays planted while the crown follows the wind.
+    """
+    if abs(sway) < 1 or root_y <= 0:
+        screen.blit(surface, pos)
+        return
+    width, height = surface.get_size()
+    strips = min(SWAY_STRIPS, int(abs(sway)) + 1)
+    strip_height = max(1, math.ceil(height / strips))
+    for top in range(0, height, strip_height):
+        rows = min(strip_height, height - top)
+        rise = max(0.0, root_y - (top + rows / 2)) / root_y
+        screen.blit(surface, (pos[0] + sway * rise * rise, pos[1] + top), (0, top, width, rows))
+
+
+class TreeLayers:
+    """Branch, snow and leaf sprites of one TreeGeometry"""
+
+    def __init__(self, geometry, branches=None, leaves=None, drawn_level=0):
+        self.geometry = geometry
+        left, top, right, bottom = geometry.bounds(LAYER_PADDING)
+        self.offset = (left, top)
+        self.size = (right - left, bottom - top)
+        if branches is None:
+            branches = indexed_surface(self.size, BRANCH_PALETTE)
+            leaves = indexed_surface(self.size, [TRANSPARENT_KEY] * 256)
+        self.branches = branches
+        self.leaves = leaves
+        self.snow = None  # Only built while there is snow to show
+        self.drawn_level = drawn_level
+        self.palette_version = -1
+        self.sprites = {}  # (layer name, scale) -> display-format copy of that layer
+        self.shared = False  # Used by several trees (see InstanceCache), so never drawn into
+
+    @classmethod
+    def from_data(cls, data):
+        """Rebuild layers from the output of rasterize_layer_data()"""
+        geometry, drawn_level, size, branches, leaves = data
+        return cls(geometry,
+                   _indexed_from_bytes(zlib.decompress(branches), size, BRANCH_PALETTE),
+                   _indexed_from_bytes(zlib.decompress(leaves), size, [TRANSPARENT_KEY] * 256),
+                   drawn_level)
+
+    def copy(self):
+        """Independent layers with the same levels drawn, to keep growing on"""
+        layers = TreeLayers(self.geometry, self.branches.copy(), self.leaves.copy(), self.drawn_level)
+        if self.snow is not None:
+            layers.snow = self.snow.copy()
+        return layers
+
+    def to_data(self):
+        """Compact picklable form: the geometry plus compressed sprite indices"""
+        return (self.geometry, self.drawn_level, self.size,
+                zlib.compress(pygame.image.tobytes(self.branches, "P"), 1),
+                zlib.compress(pygame.image.tobytes(self.leaves, "P"), 1))
+
+    def rasterize(self, max_level):
+        """Redraw every level up to `max_level` from scratch"""
+        self.branches.fill(0)
+        self.leaves.fill(0)
+        if self.snow is not None:
+            self.snow.fill(0)
+        self.drawn_level = 0
+        self.sprites.clear()
+        self.draw_levels(1, max_level)
+
+    def grow_to(self, level, budget=None):
+        """Bring the layers to `level`, drawing only the levels not yet on them.
+
+        With a `budget`, levels are added one at a time while it lasts and the
+        rest are left for later frames.
+        """
+        level = min(level, self.geometry.depth)
+        if level < self.drawn_level:
+            # Growth was restarted
+            self.rasterize(level)
+        elif budget is None:
+            if level > self.drawn_level:
+                self.draw_levels(self.drawn_level + 1, level)
+        else:
+            while self.drawn_level < level and budget.raster_segments > 0:
+                start, end = self.geometry.segment_range(self.drawn_level + 1, self.drawn_level + 1)
+                budget.raster_segments -= end - start
+                self.draw_levels(self.drawn_level + 1, self.drawn_level + 1)
+
+    def draw_levels(self, first_level, last_level):
+        """Rasterize the branches, bark, leaves and snow of the given levels"""
+        geometry = self.geometry
+        ox, oy = -self.offset[0], -self.offset[1]
+        start, end = geometry.segment_range(first_level, last_level)
+        if end > start:
+            segments = geometry.segments[start:end]
+            for (x0, y0, x1, y1, thickness), color in zip(segments.tolist(), geometry.colors[start:end].tolist()):
+                pygame.draw.line(self.branches, color, (x0 + ox, y0 + oy), (x1 + ox, y1 + oy),
+                                 max(1, int(thickness)))
+
+            bark_start, bark_end = geometry.bark_range(first_level, last_level)
+            for bx, by in geometry.bark[bark_start:bark_end].tolist():
+                pygame.draw.circle(self.branches, BARK_COLOR_INDEX, (int(bx + ox), int(by + oy)), 2)
+
+            self._drop_sprites("branches")
+
+            leaf_start, leaf_end = geometry.leaf_range(first_level, last_level)
+            if leaf_end > leaf_start:
+                self._draw_leaves(leaf_start, leaf_end)
+                self._drop_sprites("leaves")
+            if self.snow is not None:
+                self._draw_snow(start, end)
+                self._drop_sprites("snow")
+        self.drawn_level = max(self.drawn_level, min(last_level, geometry.depth))
+
+    def _draw_leaves(self, start, end):
+        ox, oy = -self.offset[0], -self.offset[1]
+        leaves = self.geometry.leaves[start:end]
+        outlines = (leaf_polygons(leaves) + (ox, oy)).tolist()
+        slots = self.geometry.leaf_slots[start:end].tolist()
+        for (x, y, size, _), outline, slot in zip(leaves.tolist(), outlines, slots):
+            pygame.draw.polygon(self.leaves, LEAF_FILL_BASE + slot, outline)
+            # Add vein
+            pygame.draw.line(self.leaves, LEAF_VEIN_BASE + slot,
+                             (x - size + ox, y + oy), (x + size + ox, y + oy), 1)
+
+    def _draw_snow(self, start, end):
+        """Snow caps resting on the thicker branches"""
+        ox, oy = -self.offset[0], -self.offset[1]
+        segments = self.geometry.segments[start:end].tolist()
+        for node, (x0, y0, x1, y1, thickness) in enumerate(segments, start):
+            if thickness <= 3:
+                continue
+            snow_x = (x0 + x1) / 2 + ox
+            snow_y = min(y0, y1) - 2 + oy
+            snow_size = int(thickness * 0.8)
+            pygame.draw.ellipse(self.snow, SNOW_BASE + node % LEAF_SLOTS,
+                                (snow_x - snow_size, snow_y - snow_size // 2, snow_size * 2, snow_size))
+
+    def _drop_sprites(self, *names):
+        for key in [key for key in self.sprites if key[0] in names]:
+            del self.sprites[key]
+
+    def sprite(self, name, scale=1.0):
+        """Display copy of a layer at `scale`, made when first needed"""
+        sprite = self.sprites.get((name, scale))
+        if sprite is None:
+            layer = getattr(self, name)
+            if layer is None:
+                return None
+            if scale != 1.0:
+                # Nearest-neighbor scaling keeps the palette indices intact
+                width, height = self.size
+                layer = pygame.transform.scale(layer, (max(1, round(width * scale)), max(1, round(height * scale))))
+            sprite = self.sprites[(name, scale)] = display_copy(layer)
+        return sprite
+
+    def recolor(self, season_blend):
+        """Swap in the current season palettes; display copies are remade on the next draw"""
+        if season_blend.snow_cover > 0 and self.snow is None:
+            self.snow = indexed_surface(self.size, [TRANSPARENT_KEY] * 256)
+            self._draw_snow(*self.geometry.segment_range(1, self.drawn_level))
+        elif season_blend.snow_cover == 0 and season_blend.settled:
+            self.snow = None
+
+        self.leaves.set_palette(season_blend.leaf_palette())
+        if self.snow is not None:
+            self.snow.set_palette(season_blend.snow_palette())
+        self._drop_sprites("leaves", "snow")
+        self.palette_version = season_blend.version
+
+    def draw_growing_tips(self, screen, pos, root_y, sway, fraction, budget=None, scale=1.0):
+        """Draw the level after `drawn_level` with its branches `fraction` grown.
+
+        These partial branches go straight to the screen every frame; they are
+        only baked into the layers once the level is complete. With too little
+        budget left, only the first branches of the level are drawn.
+        """
+        start, end = self.geometry.segment_range(self.drawn_level + 1, self.drawn_level + 1)
+        if budget is not None:
+            end = min(end, start + budget.tip_segments)
+        if end <= start:
+            return
+        if budget is not None:
+            budget.tip_segments -= end - start
+        segments = self.geometry.segments[start:end]
+        points = np.empty((len(segments), 4))
+        points[:, 0:2] = segments[:, 0:2]
+        points[:, 2:4] = segments[:, 0:2] + (segments[:, 2:4] - segments[:, 0:2]) * fraction
+        points[:, 0::2] -= self.offset[0]
+        points[:, 1::2] -= self.offset[1]
+        points *= scale
+        points[:, 0::2] += pos[0]
+        points[:, 1::2] += pos[1]
+        if abs(sway) >= 1 and root_y > 0:
+            # Follow the same bend as blit_swayed
+            base_y = pos[1] + root_y
+            for x_col, y_col in ((0, 1), (2, 3)):
+                rise = np.clip((base_y - points[:, y_col]) / root_y, 0.0, 1.0)
+                points[:, x_col] += sway * rise * rise
+        thicknesses = np.maximum(1, (segments[:, 4] * scale).astype(np.int32)).tolist()
+        colors = self.geometry.colors[start:end].tolist()
+        for (x0, y0, x1, y1), thickness, color in zip(points.tolist(), thicknesses, colors):
+            pygame.draw.line(screen, BRANCH_PALETTE[color], (x0, y0), (x1, y1), thickness)
+
+    def draw(self, screen, x, y, season_blend, wind, budget=None, growth=None, scale=1.0):
+        """Blit the layers for a tree rooted at (x, y), resized by `scale`.
+
+        A tree whose palettes are out of date keeps showing its previous
+        colors once the `budget` has no recolors left. When `growth` is ahead
+        of the drawn levels, the next level is drawn partly grown.
+        """
+        if self.palette_version < 0:
+            self.recolor(season_blend)
+        elif self.palette_version != season_blend.version:
+            if budget is None:
+                self.recolor(season_blend)
+            elif budget.recolors > 0:
+                budget.recolors -= 1
+                self.recolor(season_blend)
+
+        left, top = self.offset
+        pos = (round(x + left * scale), round(y + top * scale))
+        root_y = -top * scale
+        sway = wind * WIND_BEND * root_y
+        for name in ("branches", "snow", "leaves"):
+            sprite = self.sprite(name, scale)
+            if sprite is not None:
+                blit_swayed(screen, sprite, pos, root_y, sway)
+            if name == "branches" and growth is not None and growth - self.drawn_level > 0:
+                self.draw_growing_tips(screen, pos, root_y, sway, min(1.0, growth - self.drawn_level),
+                                       budget, scale)
@@ -4,14 +4,25 @@ import random
 import pygame_gui
 import time
 import os
+import argparse
+import itertools
 
-# Initialize Pygame
-pygame.init()
+from flock import FLOCK_SIZE, Flock
+from forest import FOREST_SEEDS, FOREST_SIZE, HORIZON_RISE, WORLD_WIDTH, forest_layout, perspective
+from geometry_pool import GeometryPool
+from geometry_store import GeometryStore
+from poster_export import PosterExport, PosterScene
+from quality import QualityGovernor
+from seasons import AUTUMN_LEAVES, SKY_COLORS, SeasonBlend
+from session_log import (HELD_KEYS, SessionRecorder, SessionReplay, frame_hash, new_session_seed, seed_random,
+                         session_path)
+from tree_geometry import generate_tree_geometry
+from tree_instances import InstanceCache, instance_params, seed_pool
+from tree_render import FrameBudget, TreeLayers
+from vector_export import export_svg
 
 # Screen dimensions
 WIDTH, HEIGHT = 1200, 800
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("🌳 Advanced Recursive Tree Simulator")
 
 # Colors
 SKY_BLUE = (135, 206, 235)
@@ -20,14 +31,6 @@ GREEN = (34, 139, 34)
 NIGHT_SKY = (25, 25, 112)
 SUNSET_SKY = (255, 99, 71)
 
-# Leaf colors for different seasons
-SPRING_LEAVES = [(144, 238, 144), (152, 251, 152), (124, 252, 0), (173, 255, 47), (186, 255, 201)]
-SUMMER_LEAVES = [(34, 139, 34), (0, 128, 0), (0, 100, 0), (46, 139, 87), (60, 179, 113)]
-AUTUMN_LEAVES = [(255, 140, 0), (255, 69, 0), (255, 99, 71), (178, 34, 34), (139, 69, 19), (205, 92, 0),
-                 (255, 165, 0), (255, 127, 80), (210, 105, 30), (160, 82, 45), (218, 165, 32), 
-                 (184, 134, 11), (189, 83, 107), (205, 133, 63), (244, 164, 96)]  # Expanded palette
-SNOW_COLORS = [(255, 255, 255), (240, 248, 255), (230, 230, 250)]
-
 # Flower colors for ground
 FLOWER_COLORS = [(255, 182, 193), (255, 105, 180), (238, 130, 238), (255, 255, 0), (255, 165, 0)]
 
@@ -163,24 +166,131 @@ class Snowflake:
     def is_off_screen(self, height):
         return self.y > height
 
+# Seeds new trees are drawn from; empty for a fresh seed every time
+tree_seed_pool = []
+
+# Orders drag previews, so the trees that waited longest go first
+preview_counter = itertools.count(1)
+
+def new_seed():
+    """Seed for a new or randomized tree"""
+    if tree_seed_pool:
+        return random.choice(tree_seed_pool)
+    return random.randint(0, 10000)
+
 class Tree:
-    def __init__(self, x, y, trunk_length=120, seed=None):
-        self.x = x
+    def __init__(self, x, y, trunk_length=120, seed=None, distance=0.0):
+        self.x = x  # Position in the scrolling world
         self.y = y
         self.trunk_length = trunk_length
-        self.seed = seed if seed else random.randint(0, 10000)
+        self.seed = seed if seed else new_seed()
+        self.distance = distance  # 0 for the nearest trees, 1 at the horizon
+        self.parallax, self.depth_drop, _ = perspective(distance)
         self.growth = 0
         self.growing = True
-        self.branch_cache = []
-        self.leaf_positions = []
-        self.snow_positions = []
+        self.geometry = None  # Cached TreeGeometry for the current parameters
+        self.layers = None    # Rasterized TreeLayers of that geometry
+        self.rebuild = None   # GeometryBuild in flight, if any
+        self.preview_time = 0  # When a drag preview was last built, counted in previews
+        self.scale = 1.0       # Sprite scale for this trunk length (see tree_instances)
     
     def reset_growth(self):
         self.growth = 0
         self.growing = True
-        self.branch_cache = []
-        self.leaf_positions = []
-        self.snow_positions = []
+    
+    def update_layers(self, depth, branch_angle, length_ratio, asymmetry, pool=None, budget=None,
+                      preview=False, instances=None, bark=True):
+        """Rebuild the cached geometry if its parameters changed and add newly grown levels.
+        
+        With a `pool`, a tree that is already on screen is rebuilt in the
+        background and keeps drawing its old layers until the new ones arrive.
+        A `preview` (a small depth while a slider is dragged) is built right
+        away instead, as long as the budget has previews left. With
+        `instances`, layers and builds are shared with every tree of the same
+        shape and growth.
+        """
+        depth = max(1, depth - self.depth_drop)
+        params, self.scale = instance_params(self.seed, depth, self.trunk_length, branch_angle,
+                                             length_ratio, asymmetry, bark)
+        if self.rebuild is not None and (self.rebuild.params != params or self.rebuild.cancelled):
+            # Superseded by newer parameters
+            self.rebuild.cancel()
+            self.rebuild = None
+        level = min(int(self.growth), depth)
+        if self.geometry is None or self.geometry.params != params:
+            shared = instances.find(params, level) if instances is not None else None
+            if shared is not None:
+                self.layers = shared
+                self.geometry = shared.geometry
+                self.rebuild = None
+            elif self.layers is None or (pool is None and not preview):
+                if instances is not None:
+                    self.geometry = instances.geometry(params)
+                else:
+                    self.geometry = generate_tree_geometry(params)
+                self.layers = TreeLayers(self.geometry)
+            elif preview:
+                if budget is None or budget.previews > 0:
+                    if budget is not None:
+                        budget.previews -= 1
+                    self.geometry = generate_tree_geometry(params)
+                    self.layers = TreeLayers(self.geometry)
+                    self.layers.grow_to(level)
+                    self.preview_time = next(preview_counter)
+            elif self.rebuild is None:
+                if instances is not None:
+                    self.rebuild = instances.build(params, level, pool)
+                else:
+                    self.rebuild = pool.submit(params, level)
+        if self.rebuild is not None and self.rebuild.done() and (budget is None or budget.rebuilds > 0):
+            if budget is not None:
+                budget.rebuilds -= 1
+            layers = self.rebuild.layers()
+            if layers is not None:
+                self.layers = layers
+                self.geometry = layers.geometry
+            self.rebuild = None
+        if self.rebuild is None and self.layers.drawn_level != min(level, self.geometry.depth):
+            shared = instances.find(self.geometry.params, level) if instances is not None else None
+            if shared is not None:
+                self.layers = shared
+            elif budget is None or budget.raster_segments > 0:
+                if self.layers.shared:
+                    # Other trees still show these layers; grow a copy instead
+                    if level > self.layers.drawn_level:
+                        self.layers = self.layers.copy()
+                    else:
+                        self.layers = TreeLayers(self.geometry)
+                self.layers.grow_to(level, budget)
+        if instances is not None and not self.layers.shared:
+            self.layers = instances.share(self.layers)
+    
+    def screen_x(self, camera_x):
+        """Horizontal screen position; distant trees scroll more slowly"""
+        return self.x - camera_x * self.parallax
+    
+    def near_view(self, camera_x):
+        """Close enough to the view to keep its layers paged in"""
+        return -PAGE_MARGIN < self.screen_x(camera_x) < WIDTH + PAGE_MARGIN
+    
+    def page_out(self):
+        """Let go of the geometry and sprites; update_layers() finds them again in the caches"""
+        self.geometry = None
+        self.layers = None
+        self.rebuild = None
+    
+    def on_screen(self, camera_x):
+        if self.layers is None:
+            return False
+        x = self.screen_x(camera_x)
+        left = self.layers.offset[0] * self.scale
+        return x + left < WIDTH and x + left + self.layers.size[0] * self.scale > 0
+    
+    def draw(self, screen, season_blend, wind, budget=None, camera_x=0):
+        if not self.on_screen(camera_x):
+            return
+        growth = self.growth if self.growing or self.layers.drawn_level < self.growth else None
+        self.layers.draw(screen, self.screen_x(camera_x), self.y, season_blend, wind, budget, growth, self.scale)
 
 class Grass:
     def __init__(self, x, y):
@@ -220,19 +330,19 @@ class Butterfly:
         self.resting = False
         self.rest_timer = 0
     
-    def update(self, wind_strength, trees):
+    def update(self, wind_strength, trees, camera_x=0):
         self.wing_phase += self.wing_speed
         
         if self.resting:
             self.rest_timer -= 1
             if self.rest_timer <= 0:
                 self.resting = False
-                self._pick_new_target(trees)
+                self._pick_new_target(trees, camera_x)
             return
         
         self.change_target_timer -= 1
         if self.change_target_timer <= 0:
-            self._pick_new_target(trees)
+            self._pick_new_target(trees, camera_x)
         
         # Move towards target with some randomness
         dx = self.target_x - self.x
@@ -248,17 +358,19 @@ class Butterfly:
                 self.resting = True
                 self.rest_timer = random.randint(60, 180)
             else:
-                self._pick_new_target(trees)
+                self._pick_new_target(trees, camera_x)
         
         # Keep in bounds
         self.x = max(50, min(WIDTH - 300, self.x))
         self.y = max(80, min(HEIGHT - 150, self.y))
     
-    def _pick_new_target(self, trees):
-        if trees and random.random() < 0.6:
+    def _pick_new_target(self, trees, camera_x=0):
+        # Butterflies fly in screen space, so only trees in view are targets
+        in_view = [tree for tree in trees if 50 <= tree.screen_x(camera_x) <= WIDTH - 300]
+        if in_view and random.random() < 0.6:
             # Target near a tree
-            tree = random.choice(trees)
-            self.target_x = tree.x + random.randint(-100, 100)
+            tree = random.choice(in_view)
+            self.target_x = tree.screen_x(camera_x) + random.randint(-100, 100)
             self.target_y = tree.y - tree.trunk_length + random.randint(-50, 100)
         else:
             # Random position
@@ -297,61 +409,13 @@ class Butterfly:
             pygame.draw.polygon(screen, self.wing_color,
                               [(self.x, self.y - 3), (self.x + self.size, self.y - self.size), (self.x + 2, self.y + 2)])
 
-class Bird:
-    """A bird that flies across the sky"""
-    def __init__(self, x=None, direction=1):
-        self.direction = direction  # 1 = right, -1 = left
-        self.x = x if x else (0 if direction == 1 else WIDTH)
-        self.y = random.randint(50, 200)
-        self.speed = random.uniform(1.5, 3.0)
-        self.wing_phase = random.uniform(0, math.pi * 2)
-        self.wing_speed = random.uniform(0.1, 0.15)
-        self.size = random.randint(8, 15)
-        self.color = random.choice([(50, 50, 50), (70, 70, 70), (30, 30, 30), (100, 80, 60)])
-        self.y_wobble = random.uniform(0, math.pi * 2)
-    
-    def update(self, wind_strength):
-        self.wing_phase += self.wing_speed
-        self.y_wobble += 0.02
-        
-        self.x += self.speed * self.direction + wind_strength * 0.2
-        self.y += math.sin(self.y_wobble) * 0.3
-    
-    def draw(self, screen):
-        wing_angle = math.sin(self.wing_phase) * 0.4
-        
-        # Body
-        pygame.draw.ellipse(screen, self.color, 
-                           (self.x - self.size // 2, self.y - 3, self.size, 6))
-        
-        # Wings
-        wing_y_offset = math.sin(self.wing_phase) * 5
-        
-        # Left wing
-        pygame.draw.line(screen, self.color,
-                        (self.x - 2, self.y),
-                        (self.x - self.size, self.y - self.size // 2 - wing_y_offset), 2)
-        
-        # Right wing
-        pygame.draw.line(screen, self.color,
-                        (self.x + 2, self.y),
-                        (self.x + self.size, self.y - self.size // 2 - wing_y_offset), 2)
-        
-        # Head
-        head_x = self.x + (self.size // 2 + 2) * self.direction
-        pygame.draw.circle(screen, self.color, (int(head_x), int(self.y - 1)), 3)
-    
-    def is_off_screen(self):
-        return self.x < -50 or self.x > WIDTH + 50
-
 # Clock for controlling frame rate
 clock = pygame.time.Clock()
 FPS = 60
 
 # Season control
 current_season = "spring"
-target_season = "spring"
-season_transition = 0  # 0 to 1 for smooth transition
+season_blend = SeasonBlend(current_season)  # Smooth leaf color transition
 
 # Wind simulation
 wind_strength = 0
@@ -365,12 +429,33 @@ growth_speed = 0.05
 falling_leaves = []
 snowflakes = []
 
+# Scales detail down when frames take too long (see quality.py)
+quality = QualityGovernor()
+
 # Flying creatures
 butterflies = []
-birds = []
+birds = Flock()
 
-# Multiple trees
-trees = [Tree(WIDTH // 2, HEIGHT - 100, 120)]
+# Multiple trees (the first one follows the trunk slider)
+trees = []  # The main tree is planted once the session seed is set
+camera_x = 0  # Left edge of the view in the scrolling world
+SCROLL_SPEED = 600  # Pixels per second while an arrow key is held
+PAGE_MARGIN = 400   # Trees this far outside the view stay paged in
+
+def plant_forest(count=FOREST_SIZE, seeds=None):
+    """Plant `count` Poisson-disk spaced trees across the world and return them.
+    
+    Trees are drawn from a few `seeds` so they share cached geometry; the
+    farther a tree stands, the smaller and simpler it is.
+    """
+    seeds = seeds or seed_pool(FOREST_SEEDS)
+    planted = []
+    for x, distance in forest_layout(count, WIDTH):
+        scale, _, rise = perspective(distance)
+        planted.append(Tree(x, HEIGHT - 100 - rise, trunk_length * scale * random.uniform(0.7, 1.0),
+                            random.choice(seeds), distance))
+    trees.extend(planted)
+    return planted
 
 # Ground vegetation
 grass_blades = []
@@ -390,20 +475,14 @@ def generate_butterflies():
         y = random.randint(150, HEIGHT - 200)
         butterflies.append(Butterfly(x, y))
 
-generate_ground_vegetation()
-generate_butterflies()  # Start with butterflies in spring
-
-# GUI Manager for sliders
-ui_manager = pygame_gui.UIManager((WIDTH, HEIGHT))
-
 # Tree parameters (adjustable)
 branch_angle = math.pi / 6  # Default: 30 degrees
 branch_length_ratio = 0.67
 trunk_length = 120
 recursion_depth = 10
+PREVIEW_DEPTH = 6  # Depth drawn while a shape slider is being dragged
+SLIDER_DEBOUNCE_TIME = 0.3  # Seconds a shape slider must rest before the full rebuild
 asymmetry = 0.15  # Branch randomness
-leaf_colors = SPRING_LEAVES
-show_leaves = True
 bg_color = (135, 206, 235)
 target_bg_color = (135, 206, 235)
 
@@ -411,122 +490,6 @@ def lerp_color(c1, c2, t):
     """Linearly interpolate between two colors"""
     return tuple(int(c1[i] + (c2[i] - c1[i]) * t) for i in range(3))
 
-def draw_leaf_shape(screen, x, y, size, color, rotation):
-    """Draw a realistic leaf shape"""
-    points = []
-    # Create leaf shape with bezier-like curve
-    for i in range(8):
-        angle = rotation + i * 45
-        rad = math.radians(angle)
-        # Vary radius to create leaf shape
-        if i in [0, 4]:
-            r = size * 1.5
-        elif i in [2, 6]:
-            r = size * 0.4
-        else:
-            r = size * 0.8
-        px = x + r * math.cos(rad)
-        py = y + r * math.sin(rad)
-        points.append((px, py))
-    if len(points) >= 3:
-        pygame.draw.polygon(screen, color, points)
-        # Add vein
-        darker = tuple(max(0, c - 30) for c in color)
-        pygame.draw.line(screen, darker, (x - size, y), (x + size, y), 1)
-
-def draw_branch_animated(surface, x, y, length, angle, current_depth, branch_thickness, 
-                         leaf_colors, show_leaves, max_depth_to_draw, original_depth, 
-                         wind_offset=0, tree_seed=0, collect_leaves=None, collect_snow=None):
-    """
-    Draws tree with growth animation, wind, and asymmetric branches
-    """
-    if current_depth <= 0:
-        return
-    
-    # Calculate what "level" we're at (1 = trunk, 2 = first branches, etc.)
-    current_level = original_depth - current_depth + 1
-    
-    # Only draw if animation has reached this level
-    if current_level > max_depth_to_draw:
-        return
-    
-    # Use seed for consistent randomness per tree
-    random.seed(tree_seed + current_depth * 1000 + int(x * 100))
-    
-    # Add wind sway - very subtle effect on thinner branches
-    wind_sway = wind_offset * (1 - branch_thickness / 15) * 0.015
-    swayed_angle = angle + wind_sway
-    
-    # Add asymmetry for natural look
-    asymmetry_offset = random.uniform(-asymmetry, asymmetry)
-    
-    # Calculate end point of the branch with sway
-    end_x = x + length * math.cos(swayed_angle)
-    end_y = y + length * math.sin(swayed_angle)
-    
-    # Choose branch color with slight variation
-    base_brown = random.randint(90, 110)
-    if branch_thickness > 5:
-        branch_color = (base_brown, base_brown - 30, base_brown - 60)
-    else:
-        branch_color = (139, 90 + random.randint(-10, 10), 43)
-    
-    # Draw the branch with rounded ends for thicker branches
-    thickness = max(1, int(branch_thickness))
-    pygame.draw.line(surface, branch_color, (x, y), (end_x, end_y), thickness)
-    
-    # Add bark texture for thick branches
-    if branch_thickness > 8:
-        for _ in range(2):
-            tx = x + random.uniform(0, end_x - x)
-            ty = y + random.uniform(0, end_y - y)
-            pygame.draw.circle(surface, (80, 50, 20), (int(tx), int(ty)), 2)
-    
-    # Draw leaves at the end of small branches
-    if current_depth <= 3 and show_leaves:
-        if leaf_colors:
-            leaf_color = random.choice(leaf_colors)
-            leaf_size = random.randint(5, 10)
-            # Use seed-based rotation so leaves don't move constantly
-            rotation = random.uniform(0, 360) + wind_offset * 0.5
-            draw_leaf_shape(surface, end_x, end_y, leaf_size, leaf_color, rotation)
-            
-            # Collect leaf positions for falling effect
-            if collect_leaves is not None and random.random() < 0.3:
-                collect_leaves.append((end_x, end_y))
-        
-        # Store snow positions for winter
-        if collect_snow is not None and current_season == "winter":
-            if random.random() < 0.4:
-                collect_snow.append((end_x, end_y - 3))
-    
-    # Draw snow accumulation on branches in winter
-    if current_season == "winter" and branch_thickness > 3:
-        snow_x = (x + end_x) / 2
-        snow_y = min(y, end_y) - 2
-        snow_size = int(branch_thickness * 0.8)
-        pygame.draw.ellipse(surface, (255, 255, 255), 
-                           (snow_x - snow_size, snow_y - snow_size//2, snow_size * 2, snow_size))
-    
-    # Reset random seed for consistent child branches
-    random.seed(tree_seed + current_depth * 1000 + int(x * 100) + 1)
-    
-    # Recursive calls with asymmetric angles
-    new_length = length * branch_length_ratio * random.uniform(0.95, 1.05)
-    new_thickness = branch_thickness * random.uniform(0.65, 0.75)
-    
-    # Left branch (asymmetric)
-    left_angle = swayed_angle - branch_angle * (1 + asymmetry_offset)
-    draw_branch_animated(surface, end_x, end_y, new_length, left_angle, current_depth - 1, 
-                        new_thickness, leaf_colors, show_leaves, max_depth_to_draw, 
-                        original_depth, wind_offset, tree_seed + 1, collect_leaves, collect_snow)
-    
-    # Right branch (asymmetric)
-    right_angle = swayed_angle + branch_angle * (1 - asymmetry_offset * 0.5)
-    draw_branch_animated(surface, end_x, end_y, new_length * 0.95, right_angle, current_depth - 1, 
-                        new_thickness, leaf_colors, show_leaves, max_depth_to_draw, 
-                        original_depth, wind_offset, tree_seed + 2, collect_leaves, collect_snow)
-
 def draw_grass(surface, grass, time_val, wind_strength):
     """Draw swaying grass blade"""
     sway = math.sin(time_val * grass.sway_speed * 0.3 + grass.sway_offset) * 1 + wind_strength * 0.5
@@ -560,411 +523,631 @@ def spawn_initial_leaves():
     """Spawn initial falling leaves for autumn - from tree canopy"""
     falling_leaves.clear()
     for tree in trees:
+        if len(falling_leaves) >= quality.level.falling_leaves:
+            break
+        if not tree.on_screen(camera_x):
+            continue
         # Spawn more leaves initially at various heights for immediate effect
         canopy_height = tree.trunk_length * 2.2
         canopy_width = tree.trunk_length * 1.5
         for _ in range(15):  # More initial leaves
-            x = tree.x + random.randint(int(-canopy_width), int(canopy_width))
+            x = tree.screen_x(camera_x) + random.randint(int(-canopy_width), int(canopy_width))
             # Spread leaves across more of the screen height
             y = tree.y - canopy_height + random.randint(-20, int(canopy_height * 0.8))
             falling_leaves.append(FallingLeaf(x, y, random.choice(AUTUMN_LEAVES), wind_strength))
 
+def export_path(name, extension):
+    """Timestamped file in screenshots/; a replay numbers it by frame, so its frames do not depend on the clock"""
+    os.makedirs("screenshots", exist_ok=True)
+    stamp = f"frame{frame:06d}" if replay is not None else time.strftime("%Y%m%d_%H%M%S")
+    return f"screenshots/{name}_{stamp}.{extension}"
+
 def save_screenshot():
     """Save a screenshot of the current tree"""
-    timestamp = time.strftime("%Y%m%d_%H%M%S")
-    filename = f"screenshots/tree_{timestamp}.png"
-    os.makedirs("screenshots", exist_ok=True)
+    filename = export_path("tree", "png")
     pygame.image.save(screen, filename)
     return filename
 
-# Create UI elements
-panel_x = WIDTH - 240
-
-# Title label
-title_label = pygame_gui.elements.UILabel(
-    relative_rect=pygame.Rect((panel_x, 10), (220, 30)),
-    text='🌳 Tree Controls',
-    manager=ui_manager
-)
-
-angle_slider = pygame_gui.elements.UIHorizontalSlider(
-    relative_rect=pygame.Rect((panel_x, 60), (200, 20)),
-    start_value=30,
-    value_range=(10, 60),
-    manager=ui_manager
-)
-angle_label = pygame_gui.elements.UILabel(
-    relative_rect=pygame.Rect((panel_x, 40), (200, 20)),
-    text='Branch Angle: 30°',
-    manager=ui_manager
-)
-
-depth_slider = pygame_gui.elements.UIHorizontalSlider(
-    relative_rect=pygame.Rect((panel_x, 110), (200, 20)),
-    start_value=10,
-    value_range=(5, 13),
-    manager=ui_manager
-)
-depth_label = pygame_gui.elements.UILabel(
-    relative_rect=pygame.Rect((panel_x, 90), (200, 20)),
-    text='Recursion Depth: 10',
-    manager=ui_manager
-)
-
-length_slider = pygame_gui.elements.UIHorizontalSlider(
-    relative_rect=pygame.Rect((panel_x, 160), (200, 20)),
-    start_value=67,
-    value_range=(50, 80),
-    manager=ui_manager
-)
-length_label = pygame_gui.elements.UILabel(
-    relative_rect=pygame.Rect((panel_x, 140), (200, 20)),
-    text='Branch Length: 67%',
-    manager=ui_manager
-)
-
-trunk_slider = pygame_gui.elements.UIHorizontalSlider(
-    relative_rect=pygame.Rect((panel_x, 210), (200, 20)),
-    start_value=120,
-    value_range=(80, 200),
-    manager=ui_manager
-)
-trunk_label = pygame_gui.elements.UILabel(
-    relative_rect=pygame.Rect((panel_x, 190), (200, 20)),
-    text='Trunk Length: 120',
-    manager=ui_manager
-)
-
-# New sliders
-speed_slider = pygame_gui.elements.UIHorizontalSlider(
-    relative_rect=pygame.Rect((panel_x, 260), (200, 20)),
-    start_value=50,
-    value_range=(10, 100),
-    manager=ui_manager
-)
-speed_label = pygame_gui.elements.UILabel(
-    relative_rect=pygame.Rect((panel_x, 240), (200, 20)),
-    text='Growth Speed: 50%',
-    manager=ui_manager
-)
-
-asymmetry_slider = pygame_gui.elements.UIHorizontalSlider(
-    relative_rect=pygame.Rect((panel_x, 310), (200, 20)),
-    start_value=15,
-    value_range=(0, 40),
-    manager=ui_manager
-)
-asymmetry_label = pygame_gui.elements.UILabel(
-    relative_rect=pygame.Rect((panel_x, 290), (200, 20)),
-    text='Asymmetry: 15%',
-    manager=ui_manager
-)
-
-wind_slider = pygame_gui.elements.UIHorizontalSlider(
-    relative_rect=pygame.Rect((panel_x, 360), (200, 20)),
-    start_value=0,
-    value_range=(-50, 50),
-    manager=ui_manager
-)
-wind_label = pygame_gui.elements.UILabel(
-    relative_rect=pygame.Rect((panel_x, 340), (200, 20)),
-    text='Wind: 0',
-    manager=ui_manager
-)
-
-# Notification text
-notification_text = ""
-notification_timer = 0
-
-# Time for animation
-game_time = 0
-
-# Main game loop
-running = True
-while running:
-    time_delta = clock.tick(FPS) / 1000.0
-    game_time += time_delta
-    
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        
-        if event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_1:
-                current_season = "spring"
-                target_bg_color = (135, 206, 235)
-                falling_leaves.clear()
-                snowflakes.clear()
-                generate_butterflies()
-            elif event.key == pygame.K_2:
-                current_season = "summer"
-                target_bg_color = (100, 149, 237)
-                falling_leaves.clear()
-                snowflakes.clear()
-                generate_butterflies()
-            elif event.key == pygame.K_3:
-                current_season = "autumn"
-                target_bg_color = (255, 200, 150)
-                spawn_initial_leaves()
-                snowflakes.clear()
-                butterflies.clear()
-                birds.clear()
-            elif event.key == pygame.K_4:
-                current_season = "winter"
-                target_bg_color = (200, 220, 240)
-                falling_leaves.clear()
-                butterflies.clear()
-                birds.clear()
-            elif event.key == pygame.K_SPACE:
-                # Restart growth for all trees
-                for tree in trees:
-                    tree.reset_growth()
-                if current_season == "autumn":
-                    spawn_initial_leaves()
-            elif event.key == pygame.K_c:
-                # Clear all trees except the main one
-                trees = [Tree(WIDTH // 2, HEIGHT - 100, trunk_length)]
-                notification_text = "Trees cleared!"
-                notification_timer = 2.0
-            elif event.key == pygame.K_s:
-                # Screenshot
-                filename = save_screenshot()
-                notification_text = f"Saved: {filename}"
-                notification_timer = 3.0
-            elif event.key == pygame.K_r:
-                # Randomize tree seed
-                for tree in trees:
-                    tree.seed = random.randint(0, 10000)
-                    tree.reset_growth()
-                notification_text = "Randomized trees!"
-                notification_timer = 2.0
-        
-        # Mouse click to plant new tree
-        if event.type == pygame.MOUSEBUTTONDOWN:
-            if event.button == 1:  # Left click
-                mx, my = event.pos
-                # Only plant in the lower area (above ground, not on UI)
-                if my > 200 and my < HEIGHT - 100 and mx < WIDTH - 250:
-                    new_tree = Tree(mx, HEIGHT - 100, trunk_length * random.uniform(0.6, 1.0))
-                    trees.append(new_tree)
-                    notification_text = f"Planted tree! ({len(trees)} total)"
-                    notification_timer = 2.0
-        
-        # Handle slider events
-        if event.type == pygame_gui.UI_HORIZONTAL_SLIDER_MOVED:
-            if event.ui_element == angle_slider:
-                branch_angle = math.radians(event.value)
-                angle_label.set_text(f'Branch Angle: {int(event.value)}°')
-            elif event.ui_element == depth_slider:
-                recursion_depth = int(event.value)
-                depth_label.set_text(f'Recursion Depth: {int(event.value)}')
-            elif event.ui_element == length_slider:
-                branch_length_ratio = event.value / 100
-                length_label.set_text(f'Branch Length: {int(event.value)}%')
-            elif event.ui_element == trunk_slider:
-                trunk_length = int(event.value)
-                trunk_label.set_text(f'Trunk Length: {int(event.value)}')
-                # Update main tree
-                if trees:
-                    trees[0].trunk_length = trunk_length
-            elif event.ui_element == speed_slider:
-                growth_speed = event.value / 1000
-                speed_label.set_text(f'Growth Speed: {int(event.value)}%')
-            elif event.ui_element == asymmetry_slider:
-                asymmetry = event.value / 100
-                asymmetry_label.set_text(f'Asymmetry: {int(event.value)}%')
-            elif event.ui_element == wind_slider:
-                wind_target = event.value / 10
-                wind_label.set_text(f'Wind: {int(event.value)}')
-        
-        ui_manager.process_events(event)
-    
-    # Smooth wind transition
-    wind_strength += (wind_target - wind_strength) * 0.02
-    
-    # Add very subtle natural wind variation (nearly still by default)
-    wind_time += time_delta
-    natural_wind = math.sin(wind_time * 0.2) * 0.02
-    current_wind = wind_strength + natural_wind
-    
-    # Update tree growth
-    for tree in trees:
-        if tree.growing:
-            tree.growth += growth_speed
-            if tree.growth >= recursion_depth:
-                tree.growth = recursion_depth
-                tree.growing = False
-    
-    # Smooth background color transition
-    bg_color = lerp_color(bg_color, target_bg_color, 0.02)
-    
-    # Select colors based on season
-    if current_season == "spring":
-        leaf_colors = SPRING_LEAVES
-        show_leaves = True
-    elif current_season == "summer":
-        leaf_colors = SUMMER_LEAVES
-        show_leaves = True
-    elif current_season == "autumn":
-        leaf_colors = AUTUMN_LEAVES
-        show_leaves = True
-    else:  # winter
-        leaf_colors = []
-        show_leaves = False
-    
-    # Clear screen with seasonal gradient
-    screen.fill(bg_color)
-    
-    # Draw gradient sky
-    for i in range(100):
-        alpha = i / 100
-        sky_color = lerp_color(bg_color, tuple(max(0, c - 30) for c in bg_color), alpha)
-        pygame.draw.line(screen, sky_color, (0, i * 2), (WIDTH, i * 2))
-    
-    # Draw sun/moon
-    if current_season == "winter":
-        # Moon
-        pygame.draw.circle(screen, (220, 220, 220), (100, 80), 30)
-        pygame.draw.circle(screen, bg_color, (110, 75), 25)  # Crescent effect
-    else:
-        # Sun
-        sun_color = (255, 220, 100) if current_season == "autumn" else (255, 255, 200)
-        pygame.draw.circle(screen, sun_color, (100, 80), 35)
-        # Sun rays
-        for i in range(8):
-            angle = i * 45 + game_time * 10
-            rad = math.radians(angle)
-            pygame.draw.line(screen, sun_color, 
-                           (100 + 40 * math.cos(rad), 80 + 40 * math.sin(rad)),
-                           (100 + 55 * math.cos(rad), 80 + 55 * math.sin(rad)), 2)
-    
-    # Draw clouds
-    cloud_offset = game_time * 10 + wind_strength * 5
-    for i in range(3):
-        cx = (200 + i * 300 + cloud_offset) % (WIDTH + 200) - 100
-        cy = 60 + i * 30
-        cloud_color = (255, 255, 255) if current_season != "winter" else (200, 200, 210)
-        pygame.draw.ellipse(screen, cloud_color, (cx, cy, 80, 30))
-        pygame.draw.ellipse(screen, cloud_color, (cx + 20, cy - 15, 60, 35))
-        pygame.draw.ellipse(screen, cloud_color, (cx + 50, cy, 70, 25))
-    
-    # Draw ground with gradient
+POSTER_SIZE = (9600, 6400)  # 8x the window; PosterExport takes any size
+
+def current_scene():
+    """PosterScene of the view as it is now, for the poster and vector exports"""
+    poster_trees = []
+    for tree in sorted(trees, key=lambda tree: -tree.distance):
+        if int(tree.growth) <= 0:
+            continue
+        params, scale = instance_params(tree.seed, recursion_depth, tree.trunk_length, branch_angle,
+                                        branch_length_ratio, asymmetry)
+        x = tree.screen_x(camera_x)
+        # Only the trees that reach into the view
+        left, top, right, bottom = tree_instances.geometry(params).bounds()
+        if x + right * scale < 0 or x + left * scale > WIDTH or tree.y + top * scale > HEIGHT:
+            continue
+        poster_trees.append((params, x, tree.y, int(tree.growth), scale))
     ground_color = (139, 69, 19) if current_season != "winter" else (200, 200, 210)
-    pygame.draw.rect(screen, ground_color, (0, HEIGHT - 100, WIDTH, 100))
-    
-    # Snow on ground in winter
-    if current_season == "winter":
-        pygame.draw.ellipse(screen, (255, 255, 255), (0, HEIGHT - 110, WIDTH, 40))
-    
-    # Draw grass (not in winter)
-    if current_season != "winter":
-        for grass in grass_blades:
-            draw_grass(screen, grass, game_time, current_wind)
-    
-    # Draw flowers (only in spring/summer)
-    if current_season in ["spring", "summer"]:
-        for flower in flowers:
-            draw_flower(screen, flower, game_time, current_wind)
-    
-    # Draw all trees
-    for tree in trees:
-        initial_angle = -math.pi / 2
-        initial_thickness = 12 * (tree.trunk_length / 120)
-        
-        draw_branch_animated(screen, tree.x, tree.y, tree.trunk_length, initial_angle, 
-                            recursion_depth, initial_thickness, leaf_colors, show_leaves, 
-                            int(tree.growth), recursion_depth, current_wind, tree.seed)
-    
-    # Update and draw falling leaves (autumn)
-    if current_season == "autumn":
-        # Spawn multiple leaves from tree canopy
-        if random.random() < 0.12 and len(falling_leaves) < 80:
-            for tree in trees:
-                if tree.growth > 5:
-                    # Spawn 1-2 leaves at a time from canopy area
-                    for _ in range(random.randint(1, 2)):
-                        canopy_height = tree.trunk_length * 2.2
-                        canopy_width = tree.trunk_length * 1.5
-                        x = tree.x + random.randint(int(-canopy_width), int(canopy_width))
-                        y = tree.y - canopy_height + random.randint(0, int(canopy_height * 0.7))
-                        falling_leaves.append(FallingLeaf(x, y, random.choice(AUTUMN_LEAVES), wind_strength))
-        
-        for leaf in falling_leaves[:]:
-            leaf.update(current_wind)
-            leaf.draw(screen)
-            if leaf.is_off_screen(HEIGHT, WIDTH):
-                falling_leaves.remove(leaf)
-    
-    # Update and draw snowflakes (winter)
-    if current_season == "winter":
-        # Spawn new snowflakes
-        if random.random() < 0.3 and len(snowflakes) < 150:
-            snowflakes.append(Snowflake(random.randint(0, WIDTH), -10))
-        
-        for flake in snowflakes[:]:
-            flake.update(current_wind)
-            flake.draw(screen)
-            if flake.is_off_screen(HEIGHT):
-                snowflakes.remove(flake)
-    
-    # Update and draw butterflies (spring/summer)
-    if current_season in ["spring", "summer"]:
-        # Spawn butterflies if not enough
-        if len(butterflies) < 5:
-            x = random.randint(100, WIDTH - 300)
-            y = random.randint(150, HEIGHT - 200)
-            butterflies.append(Butterfly(x, y))
-        
-        for butterfly in butterflies:
-            butterfly.update(current_wind, trees)
-            butterfly.draw(screen)
-    
-    # Update and draw birds (spring/summer, occasional)
-    if current_season in ["spring", "summer"]:
-        # Occasionally spawn a bird
-        if random.random() < 0.002 and len(birds) < 5:
-            direction = random.choice([1, -1])
-            birds.append(Bird(direction=direction))
-        
-        for bird in birds[:]:
-            bird.update(current_wind)
-            bird.draw(screen)
-            if bird.is_off_screen():
-                birds.remove(bird)
-    
-    # Draw UI panel background
-    pygame.draw.rect(screen, (0, 0, 0, 180), (WIDTH - 250, 0, 250, 400))
-    pygame.draw.rect(screen, (50, 50, 50), (WIDTH - 250, 0, 250, 400), 2)
-    
-    # Display controls help
-    font = pygame.font.Font(None, 24)
-    help_texts = [
-        f"Season: {current_season.upper()} (1-4)",
-        "SPACE: Restart Growth",
-        "Click: Plant Tree",
-        "C: Clear Trees",
-        "S: Screenshot",
-        "R: Randomize"
-    ]
-    
-    pygame.draw.rect(screen, (0, 0, 0, 200), (10, 10, 180, len(help_texts) * 22 + 10))
-    for i, text in enumerate(help_texts):
-        text_surface = font.render(text, True, (255, 255, 255))
-        screen.blit(text_surface, (15, 15 + i * 22))
+    return PosterScene(WIDTH, HEIGHT, bg_color, ground_color, HEIGHT - 100, current_season == "winter",
+                       poster_trees, season_blend.leaf_palette(density=1.0), season_blend.snow_palette())
+
+def start_poster_export():
+    """Start rendering the current scene as a tiled TIFF poster in the background"""
+    return PosterExport(export_path("poster", "tif"), current_scene(), POSTER_SIZE, geometry_pool.executor)
+
+def start_vector_export():
+    """Start writing the current scene as SVG in the background; the Future's result is the path"""
+    return geometry_pool.submit_job(export_svg, export_path("tree", "svg"), current_scene(), geometry_store.path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recursive tree simulator")
+    parser.add_argument("--record", nargs="?", const="", metavar="FILE",
+                        help="record the session's input (default: a new file in sessions/)")
+    parser.add_argument("--replay", metavar="FILE", help="replay a recorded session without a window")
+    parser.add_argument("--trace", metavar="CSV", help="write the frame times of a replay to CSV")
+    parser.add_argument("--hash", action="store_true", help="print a hash of the last replayed frame")
+    arguments = parser.parse_args()
+    if arguments.replay:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+    # Initialize Pygame
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("🌳 Advanced Recursive Tree Simulator")
     
-    # Show notification
-    if notification_timer > 0:
-        notification_timer -= time_delta
-        notif_surface = font.render(notification_text, True, (255, 255, 100))
-        notif_rect = notif_surface.get_rect(center=(WIDTH // 2, 50))
-        pygame.draw.rect(screen, (0, 0, 0), notif_rect.inflate(20, 10))
-        screen.blit(notif_surface, notif_rect)
+    # GUI Manager for sliders
+    ui_manager = pygame_gui.UIManager((WIDTH, HEIGHT))
     
-    # Update and draw UI
-    ui_manager.update(time_delta)
-    ui_manager.draw_ui(screen)
+    # Generated geometry is kept on disk and mapped back in
+    geometry_store = GeometryStore()
+    # Background workers for rebuilding tree geometry
+    # (none while replaying: builds then finish on the frame they are asked for)
+    geometry_pool = GeometryPool(workers=0 if arguments.replay else None, store=geometry_store)
+    # Layers shared by trees of the same shape
+    tree_instances = InstanceCache(store=geometry_store)
     
-    # Update display
-    pygame.display.flip()
+    # Create UI elements
+    panel_x = WIDTH - 240
+
+    # Title label
+    title_label = pygame_gui.elements.UILabel(
+        relative_rect=pygame.Rect((panel_x, 10), (220, 30)),
+        text='🌳 Tree Controls',
+        manager=ui_manager
+    )
+
+    angle_slider = pygame_gui.elements.UIHorizontalSlider(
+        relative_rect=pygame.Rect((panel_x, 60), (200, 20)),
+        start_value=30,
+        value_range=(10, 60),
+        manager=ui_manager
+    )
+    angle_label = pygame_gui.elements.UILabel(
+        relative_rect=pygame.Rect((panel_x, 40), (200, 20)),
+        text='Branch Angle: 30°',
+        manager=ui_manager
+    )
+
+    depth_slider = pygame_gui.elements.UIHorizontalSlider(
+        relative_rect=pygame.Rect((panel_x, 110), (200, 20)),
+        start_value=10,
+        value_range=(5, 13),
+        manager=ui_manager
+    )
+    depth_label = pygame_gui.elements.UILabel(
+        relative_rect=pygame.Rect((panel_x, 90), (200, 20)),
+        text='Recursion Depth: 10',
+        manager=ui_manager
+    )
+
+    length_slider = pygame_gui.elements.UIHorizontalSlider(
+        relative_rect=pygame.Rect((panel_x, 160), (200, 20)),
+        start_value=67,
+        value_range=(50, 80),
+        manager=ui_manager
+    )
+    length_label = pygame_gui.elements.UILabel(
+        relative_rect=pygame.Rect((panel_x, 140), (200, 20)),
+        text='Branch Length: 67%',
+        manager=ui_manager
+    )
+
+    trunk_slider = pygame_gui.elements.UIHorizontalSlider(
+        relative_rect=pygame.Rect((panel_x, 210), (200, 20)),
+        start_value=120,
+        value_range=(80, 200),
+        manager=ui_manager
+    )
+    trunk_label = pygame_gui.elements.UILabel(
+        relative_rect=pygame.Rect((panel_x, 190), (200, 20)),
+        text='Trunk Length: 120',
+        manager=ui_manager
+    )
+
+    # New sliders
+    speed_slider = pygame_gui.elements.UIHorizontalSlider(
+        relative_rect=pygame.Rect((panel_x, 260), (200, 20)),
+        start_value=50,
+        value_range=(10, 100),
+        manager=ui_manager
+    )
+    speed_label = pygame_gui.elements.UILabel(
+        relative_rect=pygame.Rect((panel_x, 240), (200, 20)),
+        text='Growth Speed: 50%',
+        manager=ui_manager
+    )
+
+    asymmetry_slider = pygame_gui.elements.UIHorizontalSlider(
+        relative_rect=pygame.Rect((panel_x, 310), (200, 20)),
+        start_value=15,
+        value_range=(0, 40),
+        manager=ui_manager
+    )
+    asymmetry_label = pygame_gui.elements.UILabel(
+        relative_rect=pygame.Rect((panel_x, 290), (200, 20)),
+        text='Asymmetry: 15%',
+        manager=ui_manager
+    )
+
+    wind_slider = pygame_gui.elements.UIHorizontalSlider(
+        relative_rect=pygame.Rect((panel_x, 360), (200, 20)),
+        start_value=0,
+        value_range=(-50, 50),
+        manager=ui_manager
+    )
+    wind_label = pygame_gui.elements.UILabel(
+        relative_rect=pygame.Rect((panel_x, 340), (200, 20)),
+        text='Wind: 0',
+        manager=ui_manager
+    )
+
+    # Recorded sessions refer to sliders by their position in this list
+    sliders = [angle_slider, depth_slider, length_slider, trunk_slider, speed_slider, asymmetry_slider,
+               wind_slider]
+
+    # Every random choice follows from one seed, so recorded input replays exactly
+    replay = SessionReplay(arguments.replay, sliders) if arguments.replay else None
+    session_seed = replay.seed if replay is not None else new_session_seed()
+    seed_random(session_seed)
+    recorder = None
+    if arguments.record is not None:
+        recorder = SessionRecorder(arguments.record or session_path(), session_seed, FPS, sliders)
+
+    trees = [Tree(WIDTH // 2, HEIGHT - 100, 120)]
+    generate_ground_vegetation()
+    generate_butterflies()  # Start with butterflies in spring
+
+    # Notification text
+    notification_text = ""
+    notification_timer = 0
+
+    # Poster being rendered in the background, if any
+    poster_export = None
+    # SVG being written in the background, if any
+    vector_export = None
+
+    # Counts down after each shape slider move; trees are previewed until it runs out
+    slider_drag_timer = 0
+
+    # Time for animation
+    game_time = 0
+
+    # Main game loop
+    running = True
+    frame = 0
+    while running:
+        # Input comes from the keyboard and mouse, or from the session being replayed
+        # (with the recorded time steps, but as fast as frames can be made)
+        if replay is not None:
+            events, held, time_delta = replay.frame(frame)
+            pygame.event.clear()
+        else:
+            time_delta = clock.tick(FPS) / 1000.0
+            events = pygame.event.get()
+            keys = pygame.key.get_pressed()
+            held = {key for key in HELD_KEYS if keys[key]}
+            if recorder is not None:
+                recorder.frame(frame, time_delta, events, held)
+        frame_start = time.perf_counter()
+        game_time += time_delta
+
+        # Scroll through the world with the arrow keys
+        if pygame.K_LEFT in held:
+            camera_x = max(0, camera_x - SCROLL_SPEED * time_delta)
+        if pygame.K_RIGHT in held:
+            camera_x = min(WORLD_WIDTH - WIDTH, camera_x + SCROLL_SPEED * time_delta)
+
+        for event in events:
+            if event.type == pygame.QUIT:
+                running = False
+
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_1:
+                    current_season = "spring"
+                    season_blend.set_target(current_season)
+                    target_bg_color = SKY_COLORS[current_season]
+                    falling_leaves.clear()
+                    snowflakes.clear()
+                    generate_butterflies()
+                elif event.key == pygame.K_2:
+                    current_season = "summer"
+                    season_blend.set_target(current_season)
+                    target_bg_color = SKY_COLORS[current_season]
+                    falling_leaves.clear()
+                    snowflakes.clear()
+                    generate_butterflies()
+                elif event.key == pygame.K_3:
+                    current_season = "autumn"
+                    season_blend.set_target(current_season)
+                    target_bg_color = SKY_COLORS[current_season]
+                    spawn_initial_leaves()
+                    snowflakes.clear()
+                    butterflies.clear()
+                    birds.clear()
+                elif event.key == pygame.K_4:
+                    current_season = "winter"
+                    season_blend.set_target(current_season)
+                    target_bg_color = SKY_COLORS[current_season]
+                    falling_leaves.clear()
+                    butterflies.clear()
+                    birds.clear()
+                elif event.key == pygame.K_SPACE:
+                    # Restart growth for all trees
+                    for tree in trees:
+                        tree.reset_growth()
+                    if current_season == "autumn":
+                        spawn_initial_leaves()
+                elif event.key == pygame.K_c:
+                    # Clear all trees except the main one
+                    trees = [Tree(camera_x + WIDTH // 2, HEIGHT - 100, trunk_length)]
+                    notification_text = "Trees cleared!"
+                    notification_timer = 2.0
+                elif event.key == pygame.K_s:
+                    # Screenshot
+                    filename = save_screenshot()
+                    notification_text = f"Saved: {filename}"
+                    notification_timer = 3.0
+                elif event.key == pygame.K_i:
+                    # Toggle drawing seeds from a small pool, so trees share geometry
+                    tree_seed_pool = [] if tree_seed_pool else seed_pool()
+                    state = "on" if tree_seed_pool else "off"
+                    notification_text = f"Seed pool {state} ({len(tree_instances)} shared layers)"
+                    notification_timer = 2.0
+                elif event.key == pygame.K_f:
+                    planted = plant_forest()
+                    notification_text = f"Planted forest of {len(planted)} trees! ({len(trees)} total)"
+                    notification_timer = 2.0
+                elif event.key == pygame.K_b and current_season in ["spring", "summer"]:
+                    if birds.flocking:
+                        birds.disperse()
+                        notification_text = "The flock disperses"
+                    else:
+                        birds.add_flock(FLOCK_SIZE, WIDTH)
+                        notification_text = f"A flock of {FLOCK_SIZE} birds!"
+                    notification_timer = 2.0
+                elif event.key == pygame.K_q:
+                    quality.set_enabled(not quality.enabled)
+                    season_blend.set_leaf_density(quality.level.leaf_density)
+                    state = "on" if quality.enabled else "off (full detail)"
+                    notification_text = f"Adaptive quality {state}"
+                    notification_timer = 2.0
+                elif event.key == pygame.K_p and poster_export is None:
+                    poster_export = start_poster_export()
+                elif event.key == pygame.K_v and vector_export is None:
+                    vector_export = start_vector_export()
+                    notification_text = "Writing SVG..."
+                    notification_timer = 1.0
+                elif event.key == pygame.K_r:
+                    # Randomize tree seed
+                    for tree in trees:
+                        tree.seed = new_seed()
+                        tree.reset_growth()
+                    notification_text = "Randomized trees!"
+                    notification_timer = 2.0
+
+            # Mouse click to plant new tree
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                if event.button == 1:  # Left click
+                    mx, my = event.pos
+                    # Only plant in the lower area (above ground, not on UI)
+                    if my > 200 and my < HEIGHT - 100 and mx < WIDTH - 250:
+                        new_tree = Tree(mx + camera_x, HEIGHT - 100, trunk_length * random.uniform(0.6, 1.0))
+                        trees.append(new_tree)
+                        notification_text = f"Planted tree! ({len(trees)} total)"
+                        notification_timer = 2.0
+
+            # Handle slider events
+            if event.type == pygame_gui.UI_HORIZONTAL_SLIDER_MOVED:
+                if event.ui_element in (angle_slider, depth_slider, length_slider, asymmetry_slider):
+                    slider_drag_timer = SLIDER_DEBOUNCE_TIME
+                if event.ui_element == angle_slider:
+                    branch_angle = math.radians(event.value)
+                    angle_label.set_text(f'Branch Angle: {int(event.value)}°')
+                elif event.ui_element == depth_slider:
+                    recursion_depth = int(event.value)
+                    depth_label.set_text(f'Recursion Depth: {int(event.value)}')
+                elif event.ui_element == length_slider:
+                    branch_length_ratio = event.value / 100
+                    length_label.set_text(f'Branch Length: {int(event.value)}%')
+                elif event.ui_element == trunk_slider:
+                    trunk_length = int(event.value)
+                    trunk_label.set_text(f'Trunk Length: {int(event.value)}')
+                    # Update main tree
+                    if trees:
+                        trees[0].trunk_length = trunk_length
+                elif event.ui_element == speed_slider:
+                    growth_speed = event.value / 1000
+                    speed_label.set_text(f'Growth Speed: {int(event.value)}%')
+                elif event.ui_element == asymmetry_slider:
+                    asymmetry = event.value / 100
+                    asymmetry_label.set_text(f'Asymmetry: {int(event.value)}%')
+                elif event.ui_element == wind_slider:
+                    wind_target = event.value / 10
+                    wind_label.set_text(f'Wind: {int(event.value)}')
+
+            if replay is None:
+                ui_manager.process_events(event)
+
+        # Smooth wind transition
+        wind_strength += (wind_target - wind_strength) * 0.02
+
+        # Add very subtle natural wind variation (nearly still by default)
+        wind_time += time_delta
+        natural_wind = math.sin(wind_time * 0.2) * 0.02
+        current_wind = wind_strength + natural_wind
+
+        # Update tree growth
+        for tree in trees:
+            if tree.growing:
+                tree.growth += growth_speed
+                if tree.growth >= recursion_depth:
+                    tree.growth = recursion_depth
+                    tree.growing = False
+
+        # Smooth background color transition
+        bg_color = lerp_color(bg_color, target_bg_color, 0.02)
+
+        # Blend leaf colors towards the selected season
+        season_blend.update(time_delta)
+
+        # Clear screen with seasonal gradient
+        screen.fill(bg_color)
+
+        # Draw gradient sky
+        for i in range(100):
+            alpha = i / 100
+            sky_color = lerp_color(bg_color, tuple(max(0, c - 30) for c in bg_color), alpha)
+            pygame.draw.line(screen, sky_color, (0, i * 2), (WIDTH, i * 2))
+
+        # Draw sun/moon
+        if current_season == "winter":
+            # Moon
+            pygame.draw.circle(screen, (220, 220, 220), (100, 80), 30)
+            pygame.draw.circle(screen, bg_color, (110, 75), 25)  # Crescent effect
+        else:
+            # Sun
+            sun_color = (255, 220, 100) if current_season == "autumn" else (255, 255, 200)
+            pygame.draw.circle(screen, sun_color, (100, 80), 35)
+            # Sun rays
+            for i in range(8):
+                angle = i * 45 + game_time * 10
+                rad = math.radians(angle)
+                pygame.draw.line(screen, sun_color, 
+                               (100 + 40 * math.cos(rad), 80 + 40 * math.sin(rad)),
+                               (100 + 55 * math.cos(rad), 80 + 55 * math.sin(rad)), 2)
+
+        # Draw clouds
+        cloud_offset = game_time * 10 + wind_strength * 5
+        for i in range(3):
+            cx = (200 + i * 300 + cloud_offset) % (WIDTH + 200) - 100
+            cy = 60 + i * 30
+            cloud_color = (255, 255, 255) if current_season != "winter" else (200, 200, 210)
+            pygame.draw.ellipse(screen, cloud_color, (cx, cy, 80, 30))
+            pygame.draw.ellipse(screen, cloud_color, (cx + 20, cy - 15, 60, 35))
+            pygame.draw.ellipse(screen, cloud_color, (cx + 50, cy, 70, 25))
+
+        # Draw ground with gradient
+        ground_color = (139, 69, 19) if current_season != "winter" else (200, 200, 210)
+        pygame.draw.rect(screen, ground_color, (0, HEIGHT - 100, WIDTH, 100))
+
+        # Trees are drawn from the farthest to the nearest
+        draw_order = sorted(trees, key=lambda tree: -tree.distance)
+
+        # Hazy meadow stretching to the horizon behind a planted forest
+        if draw_order and draw_order[0].distance > 0:
+            for i in range(HORIZON_RISE):
+                haze = 0.6 - 0.4 * i / HORIZON_RISE
+                pygame.draw.line(screen, lerp_color(ground_color, bg_color, haze),
+                                 (0, HEIGHT - 100 - HORIZON_RISE + i), (WIDTH, HEIGHT - 100 - HORIZON_RISE + i))
+
+        # Snow on ground in winter
+        if current_season == "winter":
+            pygame.draw.ellipse(screen, (255, 255, 255), (0, HEIGHT - 110, WIDTH, 40))
+
+        # Draw grass (not in winter)
+        if current_season != "winter":
+            for grass in grass_blades[:quality.level.grass]:
+                draw_grass(screen, grass, game_time, current_wind)
+
+        # Draw flowers (only in spring/summer)
+        if current_season in ["spring", "summer"]:
+            for flower in flowers:
+                draw_flower(screen, flower, game_time, current_wind)
+
+        # Draw all trees (heavy updates are spread over a few frames)
+        frame_budget = FrameBudget()
+        tree_depth = max(1, recursion_depth - quality.level.depth_drop)
+        slider_drag_timer = max(0, slider_drag_timer - time_delta)
+        # Trees far off screen are paged out and only the rest are kept up to date
+        nearby = []
+        for tree in draw_order:
+            if tree.near_view(camera_x):
+                nearby.append(tree)
+            elif tree.layers is not None:
+                tree.page_out()
+        if slider_drag_timer > 0:
+            # Still dragging: cheap previews, the trees waiting longest first
+            for tree in sorted(nearby, key=lambda tree: tree.preview_time):
+                tree.update_layers(min(tree_depth, PREVIEW_DEPTH), branch_angle, branch_length_ratio,
+                                   asymmetry, geometry_pool, frame_budget, preview=True,
+                                   instances=tree_instances, bark=quality.level.bark)
+        else:
+            for tree in nearby:
+                tree.update_layers(tree_depth, branch_angle, branch_length_ratio, asymmetry,
+                                   geometry_pool, frame_budget, instances=tree_instances,
+                                   bark=quality.level.bark)
+        for tree in nearby:
+            if tree.on_screen(camera_x):
+                tree.draw(screen, season_blend, current_wind, frame_budget, camera_x)
+                tree_instances.keep(tree.layers)
+        geometry_pool.flush()
+
+        # Keep the poster export going and report its progress
+        if poster_export is not None:
+            try:
+                finished = poster_export.update()
+            except Exception as error:
+                # A tile or the file failed (e.g. a worker died, the disk is full); give up on it
+                poster_export.cancel()
+                notification_text = f"Poster failed: {error}"
+                notification_timer = 3.0
+                poster_export = None
+            else:
+                if finished:
+                    notification_text = f"Saved: {poster_export.path}"
+                    notification_timer = 3.0
+                    poster_export = None
+                else:
+                    notification_text = f"Rendering poster... {int(poster_export.progress * 100)}%"
+                    notification_timer = 1.0
+        if vector_export is not None and vector_export.done():
+            error = vector_export.exception()
+            notification_text = f"SVG failed: {error}" if error is not None else f"Saved: {vector_export.result()}"
+            notification_timer = 3.0
+            vector_export = None
+
+        # Update and draw falling leaves (autumn)
+        if current_season == "autumn":
+            # Spawn multiple leaves from tree canopy
+            if random.random() < 0.12 and len(falling_leaves) < quality.level.falling_leaves:
+                for tree in trees:
+                    if len(falling_leaves) >= quality.level.falling_leaves:
+                        break
+                    if tree.growth > 5 and tree.on_screen(camera_x):
+                        # Spawn 1-2 leaves at a time from canopy area
+                        for _ in range(random.randint(1, 2)):
+                            canopy_height = tree.trunk_length * 2.2
+                            canopy_width = tree.trunk_length * 1.5
+                            x = tree.screen_x(camera_x) + random.randint(int(-canopy_width), int(canopy_width))
+                            y = tree.y - canopy_height + random.randint(0, int(canopy_height * 0.7))
+                            falling_leaves.append(FallingLeaf(x, y, random.choice(AUTUMN_LEAVES), wind_strength))
+
+            for leaf in falling_leaves[:]:
+                leaf.update(current_wind)
+                leaf.draw(screen)
+                if leaf.is_off_screen(HEIGHT, WIDTH):
+                    falling_leaves.remove(leaf)
+
+        # Update and draw snowflakes (winter)
+        if current_season == "winter":
+            # Spawn new snowflakes
+            if random.random() < 0.3 and len(snowflakes) < quality.level.snowflakes:
+                snowflakes.append(Snowflake(random.randint(0, WIDTH), -10))
+
+            for flake in snowflakes[:]:
+                flake.update(current_wind)
+                flake.draw(screen)
+                if flake.is_off_screen(HEIGHT):
+                    snowflakes.remove(flake)
+
+        # Update and draw butterflies (spring/summer)
+        if current_season in ["spring", "summer"]:
+            # Spawn butterflies if not enough
+            if len(butterflies) < 5:
+                x = random.randint(100, WIDTH - 300)
+                y = random.randint(150, HEIGHT - 200)
+                butterflies.append(Butterfly(x, y))
+
+            for butterfly in butterflies:
+                butterfly.update(current_wind, trees, camera_x)
+                butterfly.draw(screen)
+
+        # Update and draw birds (spring/summer, occasional)
+        if current_season in ["spring", "summer"]:
+            # Occasionally spawn a bird
+            if not birds.flocking and random.random() < 0.002 and len(birds) < 5:
+                birds.add(1, width=WIDTH)
+
+            birds.update(current_wind, WIDTH)
+            birds.draw(screen)
+
+        # Draw UI panel background
+        pygame.draw.rect(screen, (0, 0, 0, 180), (WIDTH - 250, 0, 250, 400))
+        pygame.draw.rect(screen, (50, 50, 50), (WIDTH - 250, 0, 250, 400), 2)
+
+        # Display controls help
+        font = pygame.font.Font(None, 24)
+        help_texts = [
+            f"Season: {current_season.upper()} (1-4)",
+            "SPACE: Restart Growth",
+            "Click: Plant Tree",
+            "C: Clear Trees",
+            "S: Screenshot",
+            "P: Poster Export",
+            "V: SVG Export",
+            "I: Seed Pool",
+            "F: Plant Forest",
+            "B: Bird Flock",
+            "Arrows: Scroll",
+            "R: Randomize",
+            f"Q: Quality {quality.level.name}" + (" (auto)" if quality.enabled else ""),
+        ]
+
+        pygame.draw.rect(screen, (0, 0, 0, 200), (10, 10, 215, len(help_texts) * 22 + 10))
+        for i, text in enumerate(help_texts):
+            text_surface = font.render(text, True, (255, 255, 255))
+            screen.blit(text_surface, (15, 15 + i * 22))
+
+        # Show notification
+        if notification_timer > 0:
+            notification_timer -= time_delta
+            notif_surface = font.render(notification_text, True, (255, 255, 100))
+            notif_rect = notif_surface.get_rect(center=(WIDTH // 2, 50))
+            pygame.draw.rect(screen, (0, 0, 0), notif_rect.inflate(20, 10))
+            screen.blit(notif_surface, notif_rect)
+
+        # Update and draw UI
+        ui_manager.update(time_delta)
+        ui_manager.draw_ui(screen)
+
+        # Update display
+        pygame.display.flip()
+
+        # Trade detail for frame time when frames run long, and back again
+        # (a replay follows the levels of the recorded session instead)
+        work_time = time.perf_counter() - frame_start
+        if replay is not None:
+            level_changed = replay.quality is not None and quality.set_index(replay.quality)
+        else:
+            level_changed = quality.update(work_time)
+        if level_changed:
+            season_blend.set_leaf_density(quality.level.leaf_density)
+            del falling_leaves[quality.level.falling_leaves:]
+            del snowflakes[quality.level.snowflakes:]
+
+        if recorder is not None:
+            recorder.quality(frame, quality.index)
+        if replay is not None:
+            replay.times.append((work_time, quality.index))
+            if frame + 1 >= replay.frames:
+                running = False
+        frame += 1
 
-pygame.quit()
\ No newline at end of file
+    if recorder is not None:
+        recorder.close(frame)
+    if replay is not None:
+        replay.report(arguments.trace)
+        if arguments.hash:
+            print(f"Last frame: {frame_hash(screen)}")
+    if poster_export is not None:
+        poster_export.cancel()
+    geometry_pool.shutdown()
+    geometry_store.close()
+    pygame.quit()
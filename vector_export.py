@@ -0,0 +1,211 @@
+"""
+Vector (SVG) export of the tree scene.
+
+The document is produced by a generator that walks each tree's geometry a
+level at a time, in chunks of at most CHUNK_SIZE branches or leaves, and
+yields the markup for one chunk before looking at the next. Written straight
+to a file, the export therefore needs the same small amount of memory for a
+depth-16 tree as for a sapling (with a GeometryStore, the geometry itself is
+memory-mapped too).
+
+To keep files small, branches are joined into polylines: a branch goes on
+into one of its children (which start where it ends) when the child has the
+same color and stroke width. Widths are whole pixels, as TreeLayers draws
+them, and the 21 shades of each branch color family are reduced to SHADES,
+so most twigs continue a line. Each chunk of branches starting a polyline is
+grouped by color and width, and each group becomes a single <path>. Leaves,
+leaf veins, bark dots and snow caps are merged into one path per color in
+the same way.
+Trees are placed with a transform, so coordinates are written exactly as
+they are stored. A path ending in .svgz is gzip-compressed.
+"""
+import gzip
+
+import numpy as np
+
+from geometry_store import GeometryStore
+from poster_export import SKY_GRADIENT
+from seasons import LEAF_FILL_BASE, LEAF_VEIN_BASE, SNOW_BASE, TRANSPARENT_KEY
+from tree_geometry import (BARK_COLOR_INDEX, BRANCH_PALETTE, LEAF_SLOTS, TRUNK_COLOR_BASE, TWIG_COLOR_BASE,
+                           generate_tree_geometry, leaf_polygons, level_range)
+
+CHUNK_SIZE = 4096  # Branches or leaves turned into markup at a time
+SHADES = 3         # Shades kept of each branch color family
+
+
+def _shade_table():
+    """BRANCH_PALETTE index -> index of the shade it is drawn with"""
+    table = np.arange(len(BRANCH_PALETTE))
+    for base in (TRUNK_COLOR_BASE, TWIG_COLOR_BASE):
+        band = (np.arange(21) * SHADES // 21) * 21 // SHADES + 21 // (2 * SHADES)
+        table[base:base + 21] = base + band
+    return table
+
+
+_SHADE = _shade_table()
+_SHADE_LIST = _SHADE.tolist()
+
+
+def _hex(color):
+    return "#%02x%02x%02x" % tuple(color)
+
+
+def _number(value):
+    """Shortest text for a coordinate rounded to 0.1"""
+    text = "%.1f" % value
+    if text.endswith(".0"):
+        text = text[:-2]
+    return "0" if text == "-0" else text
+
+
+def _runs(keys):
+    """(key, row indices) for every distinct key in `keys`, rows kept in their order"""
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    ends = np.r_[starts[1:], len(order)]
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        yield sorted_keys[start].item(), order[start:end]
+
+
+def _branch_keys(geometry, nodes):
+    """Shade and stroke width of branches `nodes`, packed into one integer each"""
+    widths = np.maximum(geometry.segments[nodes, 4].astype(np.int64), 1)
+    return _SHADE[geometry.colors[nodes]] << 16 | widths
+
+
+def _polyline(geometry, node, key, last):
+    """Path data for branch `node` and the children it continues into, below branch index `last`"""
+    seg, colors = geometry.segments, geometry.colors
+    x0, y0, x1, y1 = seg[node, :4].tolist()
+    parts = ["M", _number(x0), " ", _number(y0), "L", _number(x1), " ", _number(y1)]
+    while 2 * node + 1 < last:
+        # Into the left child if it matches, else into the right one (as in _branches)
+        for child in (2 * node + 1, 2 * node + 2):
+            if _SHADE_LIST[colors[child]] << 16 | max(1, int(seg[child, 4])) == key:
+                node = child
+                break
+        else:
+            break
+        parts += [" ", _number(seg[node, 2]), " ", _number(seg[node, 3])]
+    return "".join(parts)
+
+
+def _branches(geometry, last_level):
+    _, last = geometry.segment_range(1, last_level)
+    for level in range(1, last_level + 1):
+        level_start, level_end = level_range(level)
+        for start in range(level_start, level_end, CHUNK_SIZE):
+            nodes = np.arange(start, min(level_end, start + CHUNK_SIZE))
+            keys = _branch_keys(geometry, nodes)
+            if level > 1:
+                # Branches that continue their parent's polyline are drawn with it
+                parent_keys = _branch_keys(geometry, (nodes - 1) // 2)
+                left = nodes % 2 == 1
+                sibling_keys = _branch_keys(geometry, np.where(left, nodes + 1, nodes - 1))
+                continued = (keys == parent_keys) & (left | (sibling_keys != parent_keys))
+                nodes, keys = nodes[~continued], keys[~continued]
+            if not len(nodes):
+                continue
+            for key, rows in _runs(keys):
+                data = "".join(_polyline(geometry, node, key, last) for node in nodes[rows].tolist())
+                yield f'<path stroke="{_hex(BRANCH_PALETTE[key >> 16])}" stroke-width="{key & 0xFFFF}" d="{data}"/>\n'
+
+
+def _bark(geometry, last_level):
+    bark_start, bark_end = geometry.bark_range(1, last_level)
+    for start in range(bark_start, bark_end, CHUNK_SIZE):
+        dots = geometry.bark[start:min(bark_end, start + CHUNK_SIZE)].tolist()
+        # Zero-length lines with round caps are dots
+        data = "".join(f"M{_number(x)} {_number(y)}h0" for x, y in dots)
+        yield f'<path stroke="{_hex(BRANCH_PALETTE[BARK_COLOR_INDEX])}" stroke-width="4" d="{data}"/>\n'
+
+
+def _snow(geometry, last_level, snow_palette):
+    visible = np.array([snow_palette[SNOW_BASE + slot] != TRANSPARENT_KEY for slot in range(LEAF_SLOTS)])
+    if not visible.any():
+        return
+    _, last = geometry.segment_range(1, last_level)
+    seg = geometry.segments
+    for start in range(0, last, CHUNK_SIZE):
+        nodes = np.arange(start, min(last, start + CHUNK_SIZE))
+        nodes = nodes[(seg[nodes, 4] > 3) & visible[nodes % LEAF_SLOTS]]
+        parts = []
+        for x0, y0, x1, y1, thickness in seg[nodes].tolist():
+            # The ellipse TreeLayers draws, as two arcs
+            size = int(thickness * 0.8)
+            x, y = (x0 + x1) / 2 - size, min(y0, y1) - 2 - size // 2 + size / 2
+            rx, ry = _number(size), _number(size / 2)
+            parts.append(f"M{_number(x)} {_number(y)}a{rx} {ry} 0 1 0 {_number(2 * size)} 0"
+                         f"a{rx} {ry} 0 1 0 {_number(-2 * size)} 0")
+        if parts:
+            yield f'<path fill="#ffffff" d="{"".join(parts)}"/>\n'
+
+
+def _leaves(geometry, last_level, leaf_palette):
+    # Leaf slots sharing a color share a path; hidden slots are left out
+    fills = [leaf_palette[LEAF_FILL_BASE + slot] for slot in range(LEAF_SLOTS)]
+    veins = [leaf_palette[LEAF_VEIN_BASE + slot] for slot in range(LEAF_SLOTS)]
+    colors = sorted(set(fills + veins) - {TRANSPARENT_KEY})
+    fill_keys = np.array([colors.index(color) if color != TRANSPARENT_KEY else -1 for color in fills])
+    vein_keys = np.array([colors.index(color) if color != TRANSPARENT_KEY else -1 for color in veins])
+    leaf_start, leaf_end = geometry.leaf_range(1, last_level)
+    for start in range(leaf_start, leaf_end, CHUNK_SIZE):
+        end = min(leaf_end, start + CHUNK_SIZE)
+        leaves = geometry.leaves[start:end]
+        slots = geometry.leaf_slots[start:end]
+        outlines = leaf_polygons(leaves)
+        for key, rows in _runs(fill_keys[slots]):
+            if key < 0:
+                continue
+            data = "".join("M" + " ".join(_number(value) for value in outline) + "Z"
+                           for outline in outlines[rows].reshape(len(rows), -1).tolist())
+            yield f'<path fill="{_hex(colors[key])}" d="{data}"/>\n'
+        for key, rows in _runs(vein_keys[slots]):
+            if key < 0:
+                continue
+            data = "".join(f"M{_number(x - size)} {_number(y)}h{_number(2 * size)}"
+                           for x, y, size, _ in leaves[rows].tolist())
+            yield f'<path stroke="{_hex(colors[key])}" d="{data}"/>\n'
+
+
+def svg_chunks(scene, store=None):
+    """Yield the SVG document of `scene` (a PosterScene) piece by piece"""
+    width, height = scene.width, scene.height
+    dark = tuple(max(0, c - 30) for c in scene.sky_color)
+    gradient_end = min(1.0, SKY_GRADIENT / height)
+    yield (f'<svg xmlns="http://www.w3.org/2000/svg" width="{_number(width)}" height="{_number(height)}" '
+           f'viewBox="0 0 {_number(width)} {_number(height)}">\n'
+           f'<defs><linearGradient id="sky" x1="0" y1="0" x2="0" y2="1">'
+           f'<stop offset="0" stop-color="{_hex(scene.sky_color)}"/>'
+           f'<stop offset="{gradient_end:.4f}" stop-color="{_hex(dark)}"/>'
+           f'<stop offset="{gradient_end:.4f}" stop-color="{_hex(scene.sky_color)}"/></linearGradient></defs>\n'
+           f'<rect width="100%" height="100%" fill="url(#sky)"/>\n'
+           f'<rect y="{_number(scene.ground_y)}" width="100%" height="{_number(height - scene.ground_y)}" '
+           f'fill="{_hex(scene.ground_color)}"/>\n')
+    if scene.snowy_ground:
+        yield (f'<ellipse cx="{_number(width / 2)}" cy="{_number(scene.ground_y + 10)}" '
+               f'rx="{_number(width / 2)}" ry="20" fill="#ffffff"/>\n')
+
+    for params, x, y, level, tree_scale in scene.trees:
+        if level <= 0:
+            continue
+        geometry = store.load(params) if store is not None else generate_tree_geometry(params)
+        level = min(level, params.depth)
+        yield (f'<g transform="translate({_number(x)} {_number(y)}) scale({tree_scale:.4g})" '
+               f'fill="none" stroke-linecap="round" stroke-linejoin="round">\n')
+        yield from _branches(geometry, level)
+        yield from _bark(geometry, level)
+        yield from _snow(geometry, level, scene.snow_palette)
+        yield from _leaves(geometry, level, scene.leaf_palette)
+        yield "</g>\n"
+    yield "</svg>\n"
+
+
+def export_svg(path, scene, store_path=None):
+    """Worker job: write `scene` to `path` as SVG (gzip-compressed for .svgz); returns the path"""
+    store = GeometryStore(store_path, writable=False) if store_path is not None else None
+    with (gzip.open(path, "wt", compresslevel=6) if path.endswith(".svgz") else open(path, "w")) as file:
+        for chunk in svg_chunks(scene, store):
+            file.write(chunk)
+    return path